@@ -66,6 +66,12 @@ setup(
             "black>=21.0.0",
             "flake8>=3.8.0",
             "mypy>=0.800"
+        ],
+        "numba": [
+            "numba>=0.57.0"
+        ],
+        "orjson": [
+            "orjson>=3.9.0"
         ]
     },
     entry_points={
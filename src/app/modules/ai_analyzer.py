@@ -24,6 +24,7 @@ try:
     import sys
     sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
     from kdas import KDASAIAdvisor, KDASAnalyzer, get_ai_advisor, AIRecommendationEngine
+    from kdas.llm_client import aclose_shared_clients
     AI_ADVISOR_AVAILABLE = True
 except ImportError:
     AI_ADVISOR_AVAILABLE = False
@@ -31,6 +32,26 @@ except ImportError:
     KDASAnalyzer = None
     get_ai_advisor = None
     AIRecommendationEngine = None
+    aclose_shared_clients = None
+
+
+def run_async(coro):
+    """
+    在新建的事件循环中运行协程
+    
+    事件循环关闭前释放其上共享的异步客户端和信号量，它们持有事件循环的引用，
+    不释放时每次分析都会留下一个事件循环和未关闭的HTTP连接池
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        try:
+            if aclose_shared_clients is not None:
+                loop.run_until_complete(aclose_shared_clients())
+        finally:
+            loop.close()
 
 class AIAnalysisManager:
     """AI分析管理器类，封装所有AI相关功能"""
@@ -374,14 +395,7 @@ class AIAnalysisManager:
                 raise Exception("无法创建AI顾问实例")
             
             # 异步调用需要在同步函数中处理
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                kdas_result = loop.run_until_complete(
-                    advisor.analyze_all_async(security_type, symbol, api_key, model)
-                )
-            finally:
-                loop.close()
+            kdas_result = run_async(advisor.analyze_all_async(security_type, symbol, api_key, model))
             
             if not kdas_result.get('success', False):
                 # 如果AI分析失败，回退到手动模式
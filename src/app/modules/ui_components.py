@@ -38,7 +38,7 @@ try:
         load_stock_info, load_etf_info, load_index_info
     )
     from .ai_analyzer import (
-        get_ai_advisor_instance, analyze_kdas_state_with_ai
+        get_ai_advisor_instance, analyze_kdas_state_with_ai, run_async
     )
     from .chart_generator import create_mini_chart
     from .config_manager import load_ai_analysis_setting
@@ -52,7 +52,7 @@ except ImportError:
         load_stock_info, load_etf_info, load_index_info
     )
     from ai_analyzer import (
-        get_ai_advisor_instance, analyze_kdas_state_with_ai
+        get_ai_advisor_instance, analyze_kdas_state_with_ai, run_async
     )
     from chart_generator import create_mini_chart
     from config_manager import load_ai_analysis_setting
@@ -143,14 +143,7 @@ class UIComponentManager:
                         raise Exception("无法创建AI顾问实例")
                     
                     # 异步调用需要在同步函数中处理
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    try:
-                        kdas_result = loop.run_until_complete(
-                            advisor.analyze_all_async(security_type, symbol, api_key, model)
-                        )
-                    finally:
-                        loop.close()
+                    kdas_result = run_async(advisor.analyze_all_async(security_type, symbol, api_key, model))
                     
                     if not kdas_result.get('success', False):
                         # 如果AI分析失败，回退到手动模式
@@ -0,0 +1,18 @@
+"""
+Numba可选依赖的兼容层
+
+安装了numba时导出真正的njit装饰器；未安装时njit退化为原样返回函数的空装饰器，
+调用方可通过NUMBA_AVAILABLE选择JIT内核或NumPy向量化实现。
+"""
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """numba未安装时的空装饰器，支持@njit和@njit(...)两种写法"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
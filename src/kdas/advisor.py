@@ -3,7 +3,9 @@ import numpy as np
 from datetime import datetime, timedelta
 import json
 import os
-from typing import List, Dict, Tuple, Optional
+import re
+import logging
+from typing import List, Dict, Tuple, Optional, Callable
 import streamlit as st
 import asyncio
 
@@ -13,6 +15,22 @@ from .technical_analysis import TechnicalAnalyzer
 from .ai_recommendation import AIRecommendationEngine
 from .kdas_analysis import KDASAnalyzer
 from .data_handler import DataHandler
+from .llm_client import get_shared_sync_client, llm_rate_limit, check_api_key
+
+# 证券代码格式：6位数字，可带两位字母的交易所前缀或后缀（如sh000001、300328.SZ）
+SYMBOL_PATTERN = re.compile(r'^(?:[A-Za-z]{2})?\d{6}(?:\.[A-Za-z]{2})?$')
+
+logger = logging.getLogger(__name__)
+
+
+def _notify(callback: Optional[Callable], *args) -> None:
+    """调用用户提供的回调，回调抛出的异常只记录日志，不影响批量分析中其他证券的结果"""
+    if callback is None:
+        return
+    try:
+        callback(*args)
+    except Exception:
+        logger.exception("批量分析回调%s执行失败", getattr(callback, '__name__', repr(callback)))
 
 """
 KDAS智能分析系统 - 使用说明
@@ -118,9 +136,38 @@ class KDASAIAdvisor:
         # 初始化各个组件
         self.data_handler = DataHandler()
         self.technical_analyzer = TechnicalAnalyzer()
-        self.ai_engine = AIRecommendationEngine(api_key=self.api_key, model=self.model)
+        self.ai_engine = AIRecommendationEngine(api_key=self.api_key, model=self.model, technical_analyzer=self.technical_analyzer)
         self.kdas_analyzer = KDASAnalyzer(api_key=self.api_key, model=self.model)
 
+    def _configure_ai(self, api_key: str, model: str) -> bool:
+        """更新API密钥和模型，并重新初始化AI组件的客户端"""
+        self.api_key = api_key
+        self.model = model
+        self.ai_engine.api_key = api_key
+        self.ai_engine.model = model
+        self.kdas_analyzer.api_key = api_key
+        self.kdas_analyzer.model = model
+        
+        if not self.api_key:
+            return False
+        
+        # 两个AI组件共用同一同步客户端；异步客户端由各组件在请求时按当前事件循环获取，
+        # 因此同一顾问实例可以被不同线程中的多个事件循环同时使用
+        client = get_shared_sync_client(self.api_key)
+        self.ai_engine.client = client
+        self.kdas_analyzer.client = client
+        return True
+
+    async def _load_security_async(self, symbol: str, security_type: str) -> Tuple[str, pd.DataFrame]:
+        """并发获取证券名称和默认时间范围内的证券数据，两者互不依赖，在线程池中同时进行"""
+        loop = asyncio.get_running_loop()
+        default_dates = self.data_handler.generate_default_dates()
+        security_name, df = await asyncio.gather(
+            loop.run_in_executor(None, self.data_handler.get_security_name, symbol, security_type),
+            loop.run_in_executor(None, self.data_handler.get_security_data, symbol, default_dates, security_type)
+        )
+        return security_name, df
+
     async def analyze_all_async(self, security_type: str, symbol: str, api_key: str, model: str = "deepseek-r1") -> Dict:
         """
         根据证券类型和代码自动进行完整的KDAS分析
@@ -134,22 +181,7 @@ class KDASAIAdvisor:
         Returns:
             包含推荐日期和分析结果的字典
         """
-        # 更新API密钥和模型
-        self.api_key = api_key
-        self.model = model
-        self.ai_engine.api_key = api_key
-        self.ai_engine.model = model
-        self.kdas_analyzer.api_key = api_key
-        self.kdas_analyzer.model = model
-        
-        # 重新初始化AI组件的客户端
-        if self.api_key:
-            from openai import OpenAI, AsyncOpenAI
-            self.ai_engine.client = OpenAI(api_key=self.api_key, base_url="https://chatwithai.icu/v1")
-            self.ai_engine.async_client = AsyncOpenAI(api_key=self.api_key, base_url="https://chatwithai.icu/v1")
-            self.kdas_analyzer.client = OpenAI(api_key=self.api_key, base_url="https://chatwithai.icu/v1")
-            self.kdas_analyzer.async_client = AsyncOpenAI(api_key=self.api_key, base_url="https://chatwithai.icu/v1")
-        else:
+        if not self._configure_ai(api_key, model):
             return {
                 'success': False,
                 'error': 'AI API密钥未配置',
@@ -157,136 +189,223 @@ class KDASAIAdvisor:
                 'analysis': None
             }
         
+        # 在任何网络取数之前先校验代码格式和API密钥，无效时立即返回
+        if not SYMBOL_PATTERN.match(str(symbol)):
+            return {
+                'success': False,
+                'error': f'证券代码格式错误: {symbol}',
+                'recommendation': None,
+                'analysis': None
+            }
+        if not await check_api_key(self.ai_engine.async_client):
+            return {
+                'success': False,
+                'error': 'AI API密钥无效，请检查密钥是否正确',
+                'recommendation': None,
+                'analysis': None
+            }
+        
         try:
-            # 1. 获取证券信息
-            security_name = self.data_handler.get_security_name(symbol, security_type)
-            
-            # 2. 获取证券数据 - 使用默认的时间范围
-            default_dates = self.data_handler.generate_default_dates()
-            df = self.data_handler.get_security_data(symbol, default_dates, security_type)
-            
-            if df.empty:
-                return {
-                    'success': False,
-                    'error': f'未找到该{security_type}的数据，请检查{security_type}代码是否正确',
-                    'recommendation': None,
-                    'analysis': None
-                }
-            
-            # 3. 先进行日期推荐
-            recommendation_result = await self.ai_engine.generate_kdas_recommendation_async(
-                df, symbol, security_name, security_type
-            )
-            
-            if not recommendation_result.get('success', False):
-                return {
-                    'success': False,
-                    'error': f'日期推荐失败: {recommendation_result.get("error", "未知错误")}',
-                    'recommendation': recommendation_result,
-                    'analysis': None
-                }
-            
-            # 4. 使用推荐的日期计算KDAS
-            recommended_dates = recommendation_result.get('dates', [])
-            if not recommended_dates:
-                return {
-                    'success': False,
-                    'error': '未获得有效的推荐日期',
-                    'recommendation': recommendation_result,
-                    'analysis': None
-                }
-            
-            # 转换日期格式为KDAS计算所需的格式
-            input_dates = self.data_handler.format_dates_for_kdas(recommended_dates)
-            
-            # 重新获取数据以确保包含推荐日期的范围
-            df_with_kdas = self.data_handler.get_security_data(symbol, input_dates, security_type)
+            # 1-2. 获取证券信息和默认时间范围的数据
+            security_name, df = await self._load_security_async(symbol, security_type)
             
-            if df_with_kdas.empty:
-                return {
-                    'success': False,
-                    'error': '重新获取数据失败',
-                    'recommendation': recommendation_result,
-                    'analysis': None
-                }
-            
-            # 5. 计算KDAS
-            df_processed = self.data_handler.calculate_cumulative_vwap(df_with_kdas, input_dates)
-            
-            # 6. 进行KDAS状态分析
-            analysis_result = await self.kdas_analyzer.analyze_kdas_state_async(
-                df_processed, input_dates, symbol, security_name, security_type
-            )
-            
-            # 7. 获取数据摘要
-            data_summary = self.data_handler.get_data_summary(df_processed)
+            return await self._analyze_security_data(df, security_type, symbol, security_name)
             
+        except Exception as e:
             return {
-                'success': True,
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'security_info': {
-                    'symbol': symbol,
-                    'name': security_name,
-                    'type': security_type
-                },
-                'recommended_dates': recommended_dates,
-                'input_dates': input_dates,
-                'recommendation': recommendation_result,
-                'analysis': analysis_result,
-                'data_summary': data_summary
+                'success': False,
+                'error': f'完整分析失败: {str(e)}',
+                'recommendation': None,
+                'analysis': None
             }
+
+    async def _analyze_security_data(self, df: pd.DataFrame, security_type: str, symbol: str, security_name: str) -> Dict:
+        """
+        基于已获取的证券数据完成日期推荐、KDAS计算和状态分析
+        
+        Args:
+            df: 默认时间范围内的证券数据
+            security_type: 证券类型
+            symbol: 证券代码
+            security_name: 证券名称
             
-        except Exception as e:
+        Returns:
+            包含推荐日期和分析结果的字典
+        """
+        if df.empty:
             return {
                 'success': False,
-                'error': f'完整分析失败: {str(e)}',
+                'error': f'未找到该{security_type}的数据，请检查{security_type}代码是否正确',
                 'recommendation': None,
                 'analysis': None
             }
+        
+        # 3. 先进行日期推荐
+        recommendation_result = await self.ai_engine.generate_kdas_recommendation_async(
+            df, symbol, security_name, security_type
+        )
+        
+        if not recommendation_result.get('success', False):
+            return {
+                'success': False,
+                'error': f'日期推荐失败: {recommendation_result.get("error", "未知错误")}',
+                'recommendation': recommendation_result,
+                'analysis': None
+            }
+        
+        # 4. 使用推荐的日期计算KDAS
+        recommended_dates = recommendation_result.get('dates', [])
+        if not recommended_dates:
+            return {
+                'success': False,
+                'error': '未获得有效的推荐日期',
+                'recommendation': recommendation_result,
+                'analysis': None
+            }
+        
+        # 转换日期格式为KDAS计算所需的格式
+        input_dates = self.data_handler.format_dates_for_kdas(recommended_dates)
+        
+        # 重新获取数据以确保包含推荐日期的范围 - akshare请求和缓存文件读写在线程池中执行，避免阻塞事件循环
+        loop = asyncio.get_running_loop()
+        df_with_kdas = await loop.run_in_executor(
+            None, self.data_handler.get_security_data, symbol, input_dates, security_type
+        )
+        
+        if df_with_kdas.empty:
+            return {
+                'success': False,
+                'error': '重新获取数据失败',
+                'recommendation': recommendation_result,
+                'analysis': None
+            }
+        
+        # 5. 计算KDAS - 在线程池中计算，避免阻塞事件循环中其他证券的LLM请求
+        df_processed = await loop.run_in_executor(
+            None, self.data_handler.calculate_cumulative_vwap, df_with_kdas, input_dates
+        )
+        
+        # 6. 进行KDAS状态分析
+        analysis_result = await self.kdas_analyzer.analyze_kdas_state_async(
+            df_processed, input_dates, symbol, security_name, security_type
+        )
+        
+        # 7. 获取数据摘要
+        data_summary = self.data_handler.get_data_summary(df_processed)
+        
+        return {
+            'success': True,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'security_info': {
+                'symbol': symbol,
+                'name': security_name,
+                'type': security_type
+            },
+            'recommended_dates': recommended_dates,
+            'input_dates': input_dates,
+            'recommendation': recommendation_result,
+            'analysis': analysis_result,
+            'data_summary': data_summary
+        }
 
-    async def batch_analyze_securities_async(self, securities_list: List[Dict], api_key: str, model: str = "deepseek-r1") -> List[Dict]:
+    async def batch_analyze_securities_async(self, securities_list: List[Dict], api_key: str, model: str = "deepseek-r1", max_concurrency: int = 5, on_result: Optional[Callable[[Dict], None]] = None, rate_per_min: Optional[float] = None, on_progress: Optional[Callable[[int, int], None]] = None) -> List[Dict]:
         """
         批量异步分析多个证券
         
+        数据获取与AI分析以流水线方式执行：每个证券的数据一旦获取完成，
+        立即交给AI分析协程处理，无需等待其他较慢的akshare请求。
+        
         Args:
             securities_list: 证券列表，每个元素包含：
                 - security_type: str ("股票" 或 "ETF")
                 - symbol: str (证券代码)
             api_key: AI API密钥
             model: AI模型名称，默认为"deepseek-r1"
+            max_concurrency: 同时进行AI分析的最大证券数量，默认为5
+            on_result: 可选回调，每个证券分析完成时立即以其结果调用
+            rate_per_min: 本次批量分析每分钟LLM请求数上限，为空时沿用KDAS_LLM_RATE_PER_MIN配置
+            on_progress: 可选回调，每个证券分析完成时以(已完成数量, 总数量)调用
                 
         Returns:
             包含所有证券分析结果的列表
         """
+        if not self._configure_ai(api_key, model):
+            return [{
+                'success': False,
+                'error': 'AI API密钥未配置',
+                'symbol': security.get('symbol', '未知'),
+                'recommendation': None,
+                'analysis': None
+            } for security in securities_list]
+        
+        # 整批只校验一次API密钥，无效时直接返回，不再逐个证券取数和调用
+        if not await check_api_key(self.ai_engine.async_client):
+            return [{
+                'success': False,
+                'error': 'AI API密钥无效，请检查密钥是否正确',
+                'symbol': security.get('symbol', '未知'),
+                'recommendation': None,
+                'analysis': None
+            } for security in securities_list]
+        
         try:
-            # 为每个证券创建分析任务
-            tasks = []
-            for security_info in securities_list:
-                task = self.analyze_all_async(
-                    security_type=security_info['security_type'],
-                    symbol=security_info['symbol'],
-                    api_key=api_key,
-                    model=model
-                )
-                tasks.append((security_info['symbol'], task))
+            queue = asyncio.Queue()
+            final_results = [None] * len(securities_list)
+            num_workers = max(1, min(max_concurrency, len(securities_list)))
+            completed = 0
+            
+            async def fetch(index: int, security_info: Dict):
+                try:
+                    if not SYMBOL_PATTERN.match(str(security_info['symbol'])):
+                        raise ValueError(f"证券代码格式错误: {security_info['symbol']}")
+                    security_name, df = await self._load_security_async(
+                        security_info['symbol'], security_info['security_type']
+                    )
+                    return index, security_name, df, None
+                except Exception as e:
+                    return index, None, None, e
+            
+            # 阶段A：并发获取数据，按完成顺序放入队列
+            async def producer():
+                fetch_tasks = [fetch(i, security_info) for i, security_info in enumerate(securities_list)]
+                for fut in asyncio.as_completed(fetch_tasks):
+                    await queue.put(await fut)
+                for _ in range(num_workers):
+                    await queue.put(None)
             
-            # 并发执行所有任务
-            results = await asyncio.gather(*[task for _, task in tasks], return_exceptions=True)
+            # 阶段B：AI分析协程，数量即AI请求的并发上限
+            async def llm_worker():
+                nonlocal completed
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    
+                    index, security_name, df, error = item
+                    security_info = securities_list[index]
+                    symbol = security_info['symbol']
+                    try:
+                        if error is not None:
+                            raise error
+                        final_results[index] = await self._analyze_security_data(
+                            df, security_info['security_type'], symbol, security_name
+                        )
+                    except Exception as e:
+                        final_results[index] = {
+                            'success': False,
+                            'error': f'证券{symbol}分析失败: {str(e)}',
+                            'symbol': symbol,
+                            'recommendation': None,
+                            'analysis': None
+                        }
+                    
+                    completed += 1
+                    _notify(on_result, final_results[index])
+                    _notify(on_progress, completed, len(securities_list))
             
-            # 组织结果
-            final_results = []
-            for i, (symbol, _) in enumerate(tasks):
-                result = results[i]
-                if isinstance(result, Exception):
-                    final_results.append({
-                        'success': False,
-                        'error': f'证券{symbol}分析失败: {str(result)}',
-                        'symbol': symbol,
-                        'recommendation': None,
-                        'analysis': None
-                    })
-                else:
-                    final_results.append(result)
+            # 限流器通过上下文传递给各协程中的LLM请求，与max_concurrency共同避免触发429限流
+            with llm_rate_limit(rate_per_min):
+                await asyncio.gather(producer(), *[llm_worker() for _ in range(num_workers)])
             
             return final_results
             
@@ -321,10 +440,10 @@ async def analyze_security_kdas(security_type: str, symbol: str, api_key: str, m
         # 分析ETF
         result = await analyze_security_kdas("ETF", "159915", "your-api-key", "gpt-4")
     """
-    advisor = KDASAIAdvisor()
+    advisor = KDASAIAdvisor(api_key, model)
     return await advisor.analyze_all_async(security_type, symbol, api_key, model)
 
-async def batch_analyze_securities(securities_list: List[Dict], api_key: str, model: str = "deepseek-r1") -> List[Dict]:
+async def batch_analyze_securities(securities_list: List[Dict], api_key: str, model: str = "deepseek-r1", max_concurrency: int = 5, on_result: Optional[Callable[[Dict], None]] = None, rate_per_min: Optional[float] = None, on_progress: Optional[Callable[[int, int], None]] = None) -> List[Dict]:
     """
     批量分析多个证券的便捷函数
     
@@ -334,6 +453,10 @@ async def batch_analyze_securities(securities_list: List[Dict], api_key: str, mo
             - symbol: str (证券代码)
         api_key: AI API密钥
         model: AI模型名称，默认为"deepseek-r1"
+        max_concurrency: 同时进行AI分析的最大证券数量，默认为5
+        on_result: 可选回调，每个证券分析完成时立即以其结果调用
+        rate_per_min: 每分钟LLM请求数上限，为空时沿用KDAS_LLM_RATE_PER_MIN配置
+        on_progress: 可选回调，每个证券分析完成时以(已完成数量, 总数量)调用
         
     Returns:
         包含所有证券分析结果的列表
@@ -346,11 +469,16 @@ async def batch_analyze_securities(securities_list: List[Dict], api_key: str, mo
         ]
         results = await batch_analyze_securities(securities, "your-api-key")
     """
-    advisor = KDASAIAdvisor()
-    return await advisor.batch_analyze_securities_async(securities_list, api_key, model)
+    advisor = KDASAIAdvisor(api_key, model)
+    return await advisor.batch_analyze_securities_async(securities_list, api_key, model, max_concurrency, on_result, rate_per_min, on_progress)
 
 def get_ai_advisor(api_key: str = None, model: str = "deepseek-r1") -> Optional[KDASAIAdvisor]:
-    """获取KDAS AI顾问实例"""
+    """
+    获取KDAS AI顾问实例
+    
+    每次调用返回新的实例：分析方法会把传入的API密钥和模型写到实例上，不能在调用方之间共享；
+    HTTP客户端及其连接池已由llm_client在进程内共享
+    """
     if not api_key:
         api_key = os.getenv('OPENAI_API_KEY')
         
@@ -1,4 +1,4 @@
-from openai import OpenAI, AsyncOpenAI
+import asyncio
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -6,29 +6,109 @@ import json
 import re
 from typing import List, Dict, Optional
 from .technical_analysis import TechnicalAnalyzer
+from .llm_client import (
+    get_shared_sync_client, get_shared_async_client, get_llm_concurrency, get_loop_semaphore,
+    throttle_llm_request, LLM_COMPLETION_TIMEOUT
+)
+from .response_cache import ResponseCache
+from .utils import dumps_json
+
+
+# 备用解析时从回复文本中提取YYYY-MM-DD格式日期的正则
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+# prompt中保留的成交量异常数量和每侧关键价位数量
+PROMPT_MAX_VOLUME_SPIKES = 8
+PROMPT_MAX_KEY_LEVELS = 5
+
+
+class _JSONObjectTracker:
+    """增量跟踪流式回复，判断其中包含dates字段的JSON对象是否已经完整（忽略字符串内的括号）"""
+    
+    def __init__(self):
+        self.text = ''
+        self.pos = 0
+        self.start = -1
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+    
+    def feed(self, chunk: str) -> bool:
+        """
+        输入新的文本片段
+        
+        Args:
+            chunk: 新到达的文本片段
+            
+        Returns:
+            推荐结果JSON对象是否已经完整
+        """
+        self.text += chunk
+        text = self.text
+        while self.pos < len(text):
+            ch = text[self.pos]
+            self.pos += 1
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '{':
+                if self.depth == 0:
+                    self.start = self.pos - 1
+                self.depth += 1
+            elif self.depth == 0:
+                continue
+            elif ch == '"':
+                self.in_string = True
+            elif ch == '}':
+                self.depth -= 1
+                if self.depth == 0 and self._is_recommendation(text[self.start:self.pos]):
+                    return True
+        return False
+    
+    @staticmethod
+    def _is_recommendation(candidate: str) -> bool:
+        try:
+            parsed = json.loads(candidate)
+        except ValueError:
+            return False
+        return isinstance(parsed, dict) and 'dates' in parsed
 
 
 class AIRecommendationEngine:
     """AI推荐引擎 - 负责基于技术分析生成KDAS日期推荐"""
     
-    def __init__(self, api_key: str = None, model: str = "deepseek-r1"):
+    def __init__(self, api_key: str = None, model: str = "deepseek-r1", technical_analyzer: TechnicalAnalyzer = None):
         """
         初始化AI推荐引擎
         
         Args:
             api_key: AI API密钥
             model: 要使用的AI模型名称
+            technical_analyzer: 共享的技术分析器，未提供时新建
         """
         self.api_key = api_key
         self.model = model
-        if self.api_key:
-            self.client = OpenAI(api_key=self.api_key, base_url="https://chatwithai.icu/v1")
-            self.async_client = AsyncOpenAI(api_key=self.api_key, base_url="https://chatwithai.icu/v1")
-        else:
-            self.client = None
-            self.async_client = None
+        # 使用进程内按(api_key, base_url)共享的同步客户端，多个实例复用同一批keep-alive连接
+        self.client = get_shared_sync_client(self.api_key) if self.api_key else None
         
-        self.technical_analyzer = TechnicalAnalyzer()
+        self.technical_analyzer = technical_analyzer or TechnicalAnalyzer()
+        self.response_cache = ResponseCache()
+        
+        # LLM并发信号量按事件循环分别懒创建：同一实例可能被不同线程中的多个事件循环同时使用
+        self._llm_concurrency = get_llm_concurrency()
+    
+    @property
+    def async_client(self):
+        """当前事件循环共享的异步客户端，每次访问时按运行中的事件循环获取，未配置密钥时为None"""
+        return get_shared_async_client(self.api_key) if self.api_key else None
+    
+    def _get_llm_semaphore(self) -> asyncio.Semaphore:
+        """获取当前事件循环下限制LLM并发请求数的信号量"""
+        return get_loop_semaphore(self, self._llm_concurrency)
     
     def generate_kdas_recommendation(self, df: pd.DataFrame, symbol: str, security_name: str, security_type: str) -> Dict:
         """
@@ -57,11 +137,21 @@ class AIRecommendationEngine:
             # 准备发送给GPT的数据
             gpt_input = self._prepare_gpt_input(df, technical_analysis, symbol, security_name, security_type)
             
-            # 调用大语言模型
-            response = self._call_llm(gpt_input)
+            # 发送给模型的prompt完全相同时直接复用缓存的回复
+            cache_key = self._get_cache_key(gpt_input)
+            response = self.response_cache.get(cache_key)
+            cache_hit = response is not None
+            
+            if not cache_hit:
+                # 调用大语言模型
+                response = self._call_llm(gpt_input)
             
             # 解析llm回复
             recommendation = self._parse_gpt_response(response)
+            # 解析失败时会退回手动解析而不抛出异常，只缓存确实解析出推荐日期的回复，
+            # 避免空回复或截断回复在缓存有效期内被反复使用
+            if not cache_hit and recommendation.get('dates'):
+                self.response_cache.set(cache_key, response)
             
             # 验证推荐日期的有效性
             validated_dates = self._validate_recommended_dates(recommendation['dates'], df)
@@ -102,17 +192,30 @@ class AIRecommendationEngine:
             }
         
         try:
-            # 分析技术数据
-            technical_analysis = self.technical_analyzer.analyze_technical_indicators(df)
+            # 分析技术数据 - 在线程池中计算，避免阻塞事件循环中其他证券的LLM请求
+            loop = asyncio.get_running_loop()
+            technical_analysis = await loop.run_in_executor(
+                None, self.technical_analyzer.analyze_technical_indicators, df
+            )
             
             # 准备发送给GPT的数据
             gpt_input = self._prepare_gpt_input(df, technical_analysis, symbol, security_name, security_type)
             
-            # 异步调用大语言模型
-            response = await self._call_llm_async(gpt_input)
+            # 发送给模型的prompt完全相同时直接复用缓存的回复
+            cache_key = self._get_cache_key(gpt_input)
+            response = self.response_cache.get(cache_key)
+            cache_hit = response is not None
+            
+            if not cache_hit:
+                # 异步调用大语言模型
+                response = await self._call_llm_async(gpt_input)
             
             # 解析llm回复
             recommendation = self._parse_gpt_response(response)
+            # 解析失败时会退回手动解析而不抛出异常，只缓存确实解析出推荐日期的回复，
+            # 避免空回复或截断回复在缓存有效期内被反复使用
+            if not cache_hit and recommendation.get('dates'):
+                self.response_cache.set(cache_key, response)
             
             # 验证推荐日期的有效性
             validated_dates = self._validate_recommended_dates(recommendation['dates'], df)
@@ -132,6 +235,52 @@ class AIRecommendationEngine:
                 'fallback_dates': self._generate_fallback_dates(df)
             }
     
+    def _get_cache_key(self, prompt: str) -> str:
+        """
+        根据模型和完整prompt生成回复缓存键
+        
+        prompt包含证券名称和类型、数据范围、技术分析结果和当天日期等全部影响回复的输入，
+        system消息只取决于模型，因此两者相同时发送给模型的消息完全相同
+        
+        Args:
+            prompt: 发送给模型的用户消息
+            
+        Returns:
+            缓存键
+        """
+        return ResponseCache.make_key(self.model, prompt)
+    
+    @staticmethod
+    def _compact_technical_analysis(technical_analysis: Dict) -> Dict:
+        """
+        精简发送给模型的技术分析数据，减少prompt长度
+        
+        去掉与prompt开头证券信息重复的当前价格，成交量异常只保留最显著的几个，
+        关键价位只保留最近的高点和低点
+        
+        Args:
+            technical_analysis: 技术分析结果
+            
+        Returns:
+            精简后的技术分析数据（不修改原字典）
+        """
+        compact = dict(technical_analysis)
+        
+        if 'price_stats' in compact:
+            compact['price_stats'] = {k: v for k, v in compact['price_stats'].items() if k != 'current_price'}
+        if 'support_resistance' in compact:
+            compact['support_resistance'] = {k: v for k, v in compact['support_resistance'].items() if k != 'current_price'}
+        if 'volume_spikes' in compact:
+            # 成交量异常已按放大倍数从高到低排序
+            compact['volume_spikes'] = compact['volume_spikes'][:PROMPT_MAX_VOLUME_SPIKES]
+        if 'key_levels' in compact:
+            # 关键价位按日期排序，高点和低点各保留最近的几个
+            highs = [level for level in compact['key_levels'] if level['type'] == 'high'][-PROMPT_MAX_KEY_LEVELS:]
+            lows = [level for level in compact['key_levels'] if level['type'] == 'low'][-PROMPT_MAX_KEY_LEVELS:]
+            compact['key_levels'] = sorted(highs + lows, key=lambda x: x['date'])
+        
+        return compact
+    
     def _prepare_gpt_input(self, df: pd.DataFrame, technical_analysis: Dict, symbol: str, security_name: str, security_type: str) -> str:
         """准备发送给GPT的输入数据"""
         
@@ -164,7 +313,7 @@ KDAS体系原理：
 - 最近低点: {price_summary['recent_low']:.3f}元
 
 技术分析数据：
-{json.dumps(technical_analysis, ensure_ascii=False, indent=2)}
+{dumps_json(self._compact_technical_analysis(technical_analysis), indent=False)}
 
 请基于以上数据分析，推荐5个最佳的KDAS起始日期。要求：
 
@@ -214,7 +363,8 @@ KDAS体系原理：
                     }
                 ],
                 max_tokens=2000,
-                temperature=0.3
+                temperature=0.3,
+                timeout=LLM_COMPLETION_TIMEOUT
             )
             
             return response.choices[0].message.content
@@ -225,26 +375,46 @@ KDAS体系原理：
     async def _call_llm_async(self, prompt: str) -> str:
         """异步调用大语言模型"""
         try:
-            if not self.async_client:
+            async_client = self.async_client
+            if not async_client:
                 raise Exception("异步OpenAI客户端未初始化")
                 
-            response = await self.async_client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": f"你是一位专业的股票技术分析师，精通KDAS交易体系。当前使用的AI模型是{self.model}。请基于技术分析数据给出专业的KDAS日期推荐，确保回复格式严格按照JSON格式。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=2000,
-                temperature=0.3
-            )
+            async with self._get_llm_semaphore():
+                await throttle_llm_request()
+                
+                # 流式接收回复，JSON对象一旦完整即停止读取，无需等待模型输出结尾的多余内容
+                stream = await async_client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {
+                            "role": "system", 
+                            "content": f"你是一位专业的股票技术分析师，精通KDAS交易体系。当前使用的AI模型是{self.model}。请基于技术分析数据给出专业的KDAS日期推荐，确保回复格式严格按照JSON格式。"
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    max_tokens=2000,
+                    temperature=0.3,
+                    stream=True
+                )
+                
+                chunks = []
+                tracker = _JSONObjectTracker()
+                try:
+                    async for event in stream:
+                        if not event.choices:
+                            continue
+                        content = event.choices[0].delta.content
+                        if content:
+                            chunks.append(content)
+                            if tracker.feed(content):
+                                break
+                finally:
+                    await stream.close()
             
-            return response.choices[0].message.content
+            return ''.join(chunks)
             
         except Exception as e:
             raise Exception(f"异步GPT调用失败: {str(e)}")
@@ -252,11 +422,12 @@ KDAS体系原理：
     def _parse_gpt_response(self, response: str) -> Dict:
         """解析GPT回复"""
         try:
-            # 尝试提取JSON部分
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
+            # 尝试提取JSON部分（第一个'{'到最后一个'}'之间的内容）
+            start = response.find('{')
+            end = response.rfind('}')
             
-            if json_match:
-                json_str = json_match.group()
+            if start != -1 and end > start:
+                json_str = response[start:end + 1]
                 parsed = json.loads(json_str)
                 
                 return {
@@ -277,8 +448,7 @@ KDAS体系原理：
         dates = []
         
         # 寻找日期格式
-        date_pattern = r'\d{4}-\d{2}-\d{2}'
-        found_dates = re.findall(date_pattern, response)
+        found_dates = DATE_PATTERN.findall(response)
         
         # 取前5个日期
         dates = found_dates[:5]
@@ -292,19 +462,22 @@ KDAS体系原理：
     def _validate_recommended_dates(self, dates: List[str], df: pd.DataFrame) -> List[str]:
         """验证推荐日期的有效性"""
         validated_dates = []
-        df_dates = df['日期'].dt.strftime('%Y-%m-%d').tolist()
+        # 交易日一次性转换为有序的int64天数数组，成员判断和最近交易日查找都在该数组上进行
+        trading_days = np.sort(df['日期'].values.astype('datetime64[D]').astype('int64'))
+        trading_day_set = frozenset(trading_days.tolist())
         
         for date_str in dates:
             try:
                 # 检查日期格式
                 date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+                target_day = int(np.datetime64(date_obj, 'D').astype('int64'))
                 
                 # 检查日期是否在数据范围内
-                if date_str in df_dates:
-                    validated_dates.append(date_str)
+                if target_day in trading_day_set:
+                    validated_dates.append(date_obj.strftime('%Y-%m-%d'))
                 else:
                     # 寻找最接近的交易日
-                    closest_date = self._find_closest_trading_date(date_str, df_dates)
+                    closest_date = self._find_closest_trading_date(target_day, trading_days)
                     if closest_date:
                         validated_dates.append(closest_date)
                         
@@ -322,18 +495,27 @@ KDAS体系原理：
         
         return validated_dates[:5]
     
-    def _find_closest_trading_date(self, target_date: str, available_dates: List[str]) -> Optional[str]:
-        """寻找最接近的交易日"""
-        try:
-            target_dt = datetime.strptime(target_date, '%Y-%m-%d')
-            available_dts = [datetime.strptime(d, '%Y-%m-%d') for d in available_dates]
-            
-            # 寻找最接近的日期
-            closest_dt = min(available_dts, key=lambda x: abs((x - target_dt).days))
+    def _find_closest_trading_date(self, target_day: int, trading_days: np.ndarray) -> Optional[str]:
+        """
+        二分查找最接近的交易日
+        
+        Args:
+            target_day: 目标日期距1970-01-01的天数
+            trading_days: 升序排列的交易日天数数组
             
-            return closest_dt.strftime('%Y-%m-%d')
-        except:
+        Returns:
+            最接近的交易日字符串（距离相同时取较早的日期），无交易日时返回None
+        """
+        if trading_days.size == 0:
             return None
+        
+        pos = int(np.searchsorted(trading_days, target_day))
+        if pos == trading_days.size:
+            pos -= 1
+        elif pos > 0 and target_day - trading_days[pos - 1] <= trading_days[pos] - target_day:
+            pos -= 1
+        
+        return str(np.datetime64(int(trading_days[pos]), 'D'))
     
     def _generate_fallback_dates(self, df: pd.DataFrame) -> List[str]:
         """生成备用的KDAS日期（当AI推荐失败时使用）"""
@@ -356,10 +538,10 @@ KDAS体系原理：
                 0  # 最早日期
             ]
         
-        fallback_dates = []
-        for idx in indices:
-            if 0 <= idx < len(df):
-                date_str = df.iloc[idx]['日期'].strftime('%Y-%m-%d')
-                fallback_dates.append(date_str)
+        # 一次性按位置取出日期并批量格式化
+        indices = np.asarray(indices, dtype=int)
+        indices = indices[(indices >= 0) & (indices < total_days)]
+        chosen = df['日期'].to_numpy()[indices]
+        fallback_dates = pd.DatetimeIndex(chosen).strftime('%Y-%m-%d').tolist()
         
-        return list(reversed(fallback_dates))  # 按时间顺序排列 
\ No newline at end of file
+        return fallback_dates[::-1]  # 按时间顺序排列 
\ No newline at end of file
@@ -7,10 +7,12 @@ KDAS命令行接口
 import argparse
 import asyncio
 import json
+import os
 import sys
 from typing import List, Dict
 
 from .advisor import analyze_security_kdas, batch_analyze_securities
+from .llm_client import aclose_shared_clients
 
 
 def print_result(result: Dict):
@@ -75,25 +77,97 @@ async def analyze_batch(args):
         # 从命令行参数构建
         securities = [{"security_type": args.type, "symbol": args.symbol}]
     
-    print(f"正在批量分析 {len(securities)} 个证券...")
+    # 输出文件以JSON Lines格式追加写入，已有的其他格式文件（如旧版本输出的JSON数组）追加后会损坏，拒绝使用
+    if args.output and not is_jsonl_file(args.output):
+        print(f"❌ 输出文件 {args.output} 不是JSON Lines格式，请指定新的输出文件")
+        return
     
-    results = await batch_analyze_securities(securities, args.api_key, args.model)
+    # 断点续跑：跳过输出文件中已成功分析的证券
+    completed_symbols = load_completed_symbols(args.output) if args.output else set()
+    if completed_symbols:
+        pending = [s for s in securities if str(s.get('symbol')) not in completed_symbols]
+        print(f"跳过 {len(securities) - len(pending)} 个已完成的证券")
+        securities = pending
     
+    print(f"正在批量分析 {len(securities)} 个证券...")
+    
+    # 每个证券分析完成后立即打印并追加写入一行JSON，内存占用与批量大小无关
+    output_file = open(args.output, 'a', encoding='utf-8') if args.output else None
     success_count = 0
-    for result in results:
+    
+    def on_result(result: Dict):
+        nonlocal success_count
         print_result(result)
         if result['success']:
             success_count += 1
         print("-" * 50)
+        
+        if output_file:
+            output_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+            output_file.flush()
+    
+    def on_progress(done: int, total: int):
+        print(f"进度: {done}/{total}")
+    
+    try:
+        results = await batch_analyze_securities(securities, args.api_key, args.model, on_result=on_result, on_progress=on_progress)
+    finally:
+        if output_file:
+            output_file.close()
     
     print(f"\n批量分析完成: {success_count}/{len(results)} 成功")
     
     if args.output:
-        with open(args.output, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
         print(f"结果已保存到: {args.output}")
 
 
+async def run_command(command, args):
+    """
+    在命令行创建的事件循环中执行命令
+    
+    命令行是事件循环的所有者，命令结束后由这里统一关闭该事件循环共享的异步客户端，
+    释放其HTTP连接池；各分析组件本身不关闭共享客户端
+    """
+    try:
+        await command(args)
+    finally:
+        await aclose_shared_clients()
+
+
+def is_jsonl_file(path: str) -> bool:
+    """判断文件是否可以按JSON Lines格式追加写入：文件不存在、为空或首个非空行是JSON对象"""
+    if not os.path.exists(path):
+        return True
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                return isinstance(json.loads(line), dict)
+            except ValueError:
+                return False
+    return True
+
+
+def load_completed_symbols(output_path: str) -> set:
+    """读取JSON Lines输出文件中已成功分析的证券代码"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(result, dict) and result.get('success'):
+                completed.add(str(result['security_info']['symbol']))
+    
+    return completed
+
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description="KDAS智能分析系统命令行工具")
@@ -101,7 +175,7 @@ def main():
     # 全局参数
     parser.add_argument("--api-key", required=True, help="AI API密钥")
     parser.add_argument("--model", default="deepseek-r1", help="AI模型名称 (默认: deepseek-r1)")
-    parser.add_argument("--output", "-o", help="输出文件路径")
+    parser.add_argument("--output", "-o", help="输出文件路径 (批量分析时以JSON Lines格式逐条追加写入，重新运行会跳过已成功的证券)")
     
     # 子命令
     subparsers = parser.add_subparsers(dest="command", help="可用命令")
@@ -125,9 +199,9 @@ def main():
     
     try:
         if args.command == "analyze":
-            asyncio.run(analyze_single(args))
+            asyncio.run(run_command(analyze_single, args))
         elif args.command == "batch":
-            asyncio.run(analyze_batch(args))
+            asyncio.run(run_command(analyze_batch, args))
     except KeyboardInterrupt:
         print("\n用户中断")
         sys.exit(1)
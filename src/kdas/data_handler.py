@@ -2,8 +2,226 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import os
-from typing import Dict, List
+import time
+import tempfile
+import functools
+from typing import Dict, List, Optional, Tuple
 import asyncio
+from ._njit import njit, NUMBA_AVAILABLE
+
+
+# 缓存文件中显式保存为float64的数值列
+CACHE_FLOAT_COLUMNS = ['开盘', '收盘', '最高', '最低', '成交额', '成交量']
+
+# 证券类型 -> (缓存文件夹, akshare接口函数名, 接口附加参数)
+SECURITY_API_TABLE = {
+    "股票": ('shares', 'stock_zh_a_hist', {'period': 'daily', 'adjust': 'qfq'}),
+    "ETF": ('etfs', 'fund_etf_hist_em', {'period': 'daily', 'adjust': 'qfq'}),
+    "指数": ('stocks', 'stock_zh_index_daily', {}),
+}
+
+# 证券代码-名称映射在进程内的缓存有效期（秒）
+SECURITY_NAME_CACHE_TTL = 3600
+
+
+def _write_feather_atomic(df: pd.DataFrame, file_path: str) -> None:
+    """
+    先写入同目录下唯一命名的临时文件，再原子替换为目标文件
+    
+    临时文件名对每次写入唯一，多个线程同时写入同一文件时互不覆盖对方的临时文件，
+    读取方只会看到某一次完整写入的结果。写入失败时删除临时文件。
+    
+    Args:
+        df: 待写入的DataFrame
+        file_path: 目标文件路径
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_feather(tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _read_code_name_table(csv_path: str) -> pd.DataFrame:
+    """
+    读取本地证券代码-名称表
+    
+    首次读取CSV后在同目录保存Feather副本，之后CSV未更新时直接读取Feather，无需重新解析CSV。
+    
+    Args:
+        csv_path: 代码-名称表CSV文件路径
+        
+    Returns:
+        代码-名称表DataFrame，代码列为字符串
+    """
+    feather_path = f'{os.path.splitext(csv_path)[0]}.feather'
+    try:
+        if os.path.getmtime(feather_path) >= os.path.getmtime(csv_path):
+            return pd.read_feather(feather_path)
+    except OSError:
+        pass
+    
+    df = pd.read_csv(csv_path, dtype={0: str})
+    try:
+        _write_feather_atomic(df, feather_path)
+    except (OSError, ValueError, TypeError, ImportError):
+        # 副本写入失败不影响本次读取，下次仍从CSV读取
+        pass
+    return df
+
+
+@functools.lru_cache(maxsize=2)
+def _load_stock_map(ttl_bucket: int) -> Dict[str, str]:
+    """
+    加载股票代码到名称的映射
+    
+    Args:
+        ttl_bucket: 缓存时间桶，时间桶变化后重新加载
+        
+    Returns:
+        {股票代码: 股票名称} 字典
+    """
+    # 尝试从本地文件获取
+    if os.path.exists('shares/A股全部股票代码.csv'):
+        stock_info_df = _read_code_name_table('shares/A股全部股票代码.csv')
+        if '股票代码' in stock_info_df.columns and '股票名称' in stock_info_df.columns:
+            stock_info_df = stock_info_df.rename(columns={"股票代码": "code", "股票名称": "name"})
+    else:
+        import akshare as ak
+        stock_info_df = ak.stock_info_a_code_name()
+        stock_info_df = stock_info_df.rename(columns={"股票代码": "code", "股票名称": "name"})
+    
+    return dict(zip(stock_info_df["code"], stock_info_df["name"]))
+
+
+@functools.lru_cache(maxsize=2)
+def _load_etf_map(ttl_bucket: int) -> Dict[str, str]:
+    """
+    加载ETF代码到名称的映射
+    
+    Args:
+        ttl_bucket: 缓存时间桶，时间桶变化后重新加载
+        
+    Returns:
+        {ETF代码: ETF名称} 字典
+    """
+    # 尝试从本地文件获取
+    if os.path.exists('etfs/A股全部ETF代码.csv'):
+        etf_info_df = _read_code_name_table('etfs/A股全部ETF代码.csv')
+    else:
+        import akshare as ak
+        etf_info_df = ak.fund_etf_spot_em()
+        etf_info_df = etf_info_df[['代码', '名称']].drop_duplicates().rename(columns={"代码": "code", "名称": "name"})
+    
+    return dict(zip(etf_info_df["code"], etf_info_df["name"]))
+
+
+def _compact_dates_to_days(date_strs: List[str]) -> np.ndarray:
+    """
+    将YYYYMMDD格式的日期字符串批量转换为datetime64[D]数组
+    
+    Args:
+        date_strs: YYYYMMDD格式的日期字符串列表
+        
+    Returns:
+        datetime64[D]数组
+    """
+    for date_str in date_strs:
+        if len(date_str) != 8 or not date_str.isdigit():
+            raise ValueError(f"日期格式错误，应为YYYYMMDD: {date_str}")
+    
+    # numpy只解析ISO格式，先插入分隔符再整体转换
+    return np.array([f'{d[:4]}-{d[4:6]}-{d[6:]}' for d in date_strs], dtype='datetime64[D]')
+
+
+@njit(cache=True, error_model='numpy')
+def _kdas_njit(amount: np.ndarray, volume: np.ndarray, starts: np.ndarray):
+    """
+    KDAS计算的JIT内核，每个起始日期从起始行开始单次累加
+    
+    不使用parallel=True：异步分析会在多个线程池线程中同时调用本内核，numba的并行线程层不支持多线程并发进入
+    
+    Args:
+        amount: 成交额数组
+        volume: 成交量数组
+        starts: 各起始日期所在的行号
+        
+    Returns:
+        (累计成交额, 累计成交量, 未取整的KDAS) 三个形状为(起始日期数, 行数)的数组，起始行之前为NaN
+    """
+    n = amount.shape[0]
+    k_count = starts.shape[0]
+    cum_amount = np.full((k_count, n), np.nan)
+    cum_volume = np.full((k_count, n), np.nan)
+    kdas = np.full((k_count, n), np.nan)
+    for k in range(k_count):
+        total_amount = 0.0
+        total_volume = 0.0
+        for i in range(starts[k], n):
+            # 与pandas的cumsum一致：NaN所在行的累计值为NaN，不计入之后的累计值
+            if not np.isnan(amount[i]):
+                total_amount += amount[i]
+                cum_amount[k, i] = total_amount
+            if not np.isnan(volume[i]):
+                total_volume += volume[i]
+                cum_volume[k, i] = total_volume
+            kdas[k, i] = cum_amount[k, i] / cum_volume[k, i] / 100
+    return cum_amount, cum_volume, kdas
+
+
+def _kdas_core(dates_i8: np.ndarray, amount: np.ndarray, volume: np.ndarray,
+               anchor_i8: np.ndarray) -> Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    KDAS计算核心 - 只基于NumPy数组，不依赖DataFrame
+    
+    Args:
+        dates_i8: 按升序排列的交易日（int64纳秒时间戳）
+        amount: 成交额数组
+        volume: 成交量数组
+        anchor_i8: KDAS起始日期（int64纳秒时间戳）
+        
+    Returns:
+        {起始日期在anchor_i8中的位置: (累计成交额, 累计成交量, 未取整的KDAS)}，
+        起始日期之前的行为NaN，数据中不存在的起始日期不包含在结果中
+    """
+    n = len(dates_i8)
+    positions = dates_i8.searchsorted(anchor_i8)
+    
+    if NUMBA_AVAILABLE:
+        found = [k for k, idx in enumerate(positions) if idx < n and dates_i8[idx] == anchor_i8[k]]
+        starts = positions[found].astype(np.int64)
+        cum_amount, cum_volume, kdas = _kdas_njit(amount, volume, starts)
+        return {k: (cum_amount[j], cum_volume[j], kdas[j]) for j, k in enumerate(found)}
+    
+    # 与pandas的cumsum一致：NaN不计入前缀和，只有NaN所在行的累计值为NaN
+    cum_amount = np.nancumsum(amount)
+    cum_volume = np.nancumsum(volume)
+    amount_nan = np.isnan(amount)
+    volume_nan = np.isnan(volume)
+    results = {}
+    for k, idx in enumerate(positions):
+        if idx >= n or dates_i8[idx] != anchor_i8[k]:
+            continue
+        
+        # 从起始日开始的累计值 = 全量前缀和 - 起始日之前的前缀和
+        anchor_amount = np.full(n, np.nan)
+        anchor_volume = np.full(n, np.nan)
+        np.subtract(cum_amount[idx:], cum_amount[idx - 1] if idx else 0.0, out=anchor_amount[idx:])
+        np.subtract(cum_volume[idx:], cum_volume[idx - 1] if idx else 0.0, out=anchor_volume[idx:])
+        anchor_amount[idx:][amount_nan[idx:]] = np.nan
+        anchor_volume[idx:][volume_nan[idx:]] = np.nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kdas = anchor_amount / anchor_volume / 100
+        
+        results[k] = (anchor_amount, anchor_volume, kdas)
+    
+    return results
 
 
 class DataHandler:
@@ -16,34 +234,15 @@ class DataHandler:
     def get_security_name(self, symbol: str, security_type: str) -> str:
         """获取证券名称"""
         try:
-            import akshare as ak
-            
             # 清理代码格式
             symbol = symbol.split('.')[0]
+            ttl_bucket = int(time.time() // SECURITY_NAME_CACHE_TTL)
             
             if security_type == "股票":
-                # 尝试从本地文件获取
-                if os.path.exists('shares/A股全部股票代码.csv'):
-                    stock_info_df = pd.read_csv('shares/A股全部股票代码.csv', dtype={0: str})
-                    if '股票代码' in stock_info_df.columns and '股票名称' in stock_info_df.columns:
-                        stock_info_df = stock_info_df.rename(columns={"股票代码": "code", "股票名称": "name"})
-                else:
-                    stock_info_df = ak.stock_info_a_code_name()
-                    stock_info_df = stock_info_df.rename(columns={"股票代码": "code", "股票名称": "name"})
-                
-                name_series = stock_info_df[stock_info_df["code"] == symbol]["name"]
-                return name_series.values[0] if len(name_series) > 0 else f"未知股票"
+                return _load_stock_map(ttl_bucket).get(symbol, f"未知股票")
                 
             elif security_type == "ETF":
-                # 尝试从本地文件获取
-                if os.path.exists('etfs/A股全部ETF代码.csv'):
-                    etf_info_df = pd.read_csv('etfs/A股全部ETF代码.csv', dtype={0: str})
-                else:
-                    etf_info_df = ak.fund_etf_spot_em()
-                    etf_info_df = etf_info_df[['代码', '名称']].drop_duplicates().rename(columns={"代码": "code", "名称": "name"})
-                
-                name_series = etf_info_df[etf_info_df["code"] == symbol]["name"]
-                return name_series.values[0] if len(name_series) > 0 else f"未知ETF"
+                return _load_etf_map(ttl_bucket).get(symbol, f"未知ETF")
                 
             else:
                 return f"未知{security_type}"
@@ -51,6 +250,12 @@ class DataHandler:
         except Exception as e:
             return f"未知{security_type}"
     
+    @staticmethod
+    def clear_security_name_cache() -> None:
+        """清除进程内缓存的证券代码-名称映射，下次查询时重新加载"""
+        _load_stock_map.cache_clear()
+        _load_etf_map.cache_clear()
+    
     def generate_default_dates(self) -> Dict:
         """生成默认的日期范围用于数据获取"""
         # 生成一个较大的时间范围以确保能获取足够的历史数据
@@ -68,51 +273,36 @@ class DataHandler:
     def get_security_data(self, symbol: str, input_date: Dict, security_type: str = "股票") -> pd.DataFrame:
         """获取证券数据"""
         try:
-            import akshare as ak
-            
             # 转换代码格式（如300328.SZ -> 300328）
             symbol = symbol.split('.')[0]
             start_date = min(input_date.values())
             today = datetime.now().strftime('%Y%m%d')
             
             # 根据证券类型选择文件夹和API
-            if security_type == "股票":
-                folder = 'shares'
-                api_func = lambda: ak.stock_zh_a_hist(symbol=symbol, period="daily", start_date=start_date, adjust="qfq")
-                api_func_update = lambda last_date: ak.stock_zh_a_hist(symbol=symbol, period="daily", start_date=last_date, adjust="qfq")
-            elif security_type == "ETF":
-                folder = 'etfs'
-                api_func = lambda: ak.fund_etf_hist_em(symbol=symbol, period="daily", start_date=start_date, adjust="qfq")
-                api_func_update = lambda last_date: ak.fund_etf_hist_em(symbol=symbol, period="daily", start_date=last_date, adjust="qfq")
-            elif security_type == "指数":
-                folder = 'stocks'
-                api_func = lambda: ak.stock_zh_index_daily(symbol=symbol, start_date=start_date)
-                api_func_update = lambda last_date: ak.stock_zh_index_daily(symbol=symbol, start_date=last_date)
-            else:
+            if security_type not in SECURITY_API_TABLE:
                 raise ValueError(f"不支持的证券类型: {security_type}")
+            folder, api_name, api_kwargs = SECURITY_API_TABLE[security_type]
             
             # 确保文件夹存在
             os.makedirs(folder, exist_ok=True)
-            file_path = f'{folder}/{symbol}.csv'
+            file_path = f'{folder}/{symbol}.feather'
             
-            if os.path.exists(file_path):
-                df = pd.read_csv(file_path)
-                df['日期'] = pd.to_datetime(df['日期'])
-                
+            df = self._read_cached_data(folder, symbol)
+            if df is not None:
                 # 转换start_date为Timestamp以便比较
                 start_date_ts = pd.to_datetime(start_date)
                 if not (df['日期'] == start_date_ts).any():
-                    df = api_func()
+                    df = self._fetch_from_api(api_name, api_kwargs, symbol, start_date)
                     if not df.empty:
                         # 确保日期列格式正确
                         df['日期'] = pd.to_datetime(df['日期'])
-                        df.to_csv(file_path, index=False)
+                        self._write_cached_data(df, file_path)
                 else:
                     # 检查是否需要更新数据
                     last_date_in_df = df['日期'].iloc[-1]
                     today_ts = pd.to_datetime(today)
                     if last_date_in_df < today_ts:
-                        df_add = api_func_update(last_date_in_df.strftime('%Y%m%d'))
+                        df_add = self._fetch_from_api(api_name, api_kwargs, symbol, last_date_in_df.strftime('%Y%m%d'))
                         if not df_add.empty:
                             # 确保新数据的日期列格式正确
                             df_add['日期'] = pd.to_datetime(df_add['日期'])
@@ -120,20 +310,19 @@ class DataHandler:
                             df = pd.concat([df, df_add], ignore_index=True)
                             # 去重并排序
                             df = df.drop_duplicates(subset=['日期']).sort_values('日期').reset_index(drop=True)
-                            df.to_csv(file_path, index=False)
+                            self._write_cached_data(df, file_path)
             else:
-                df = api_func()
+                df = self._fetch_from_api(api_name, api_kwargs, symbol, start_date)
                 if not df.empty:
                     # 确保日期列格式正确
                     df['日期'] = pd.to_datetime(df['日期'])
-                    df.to_csv(file_path, index=False)
+                    self._write_cached_data(df, file_path)
             
             # 确保数据不为空且格式正确
             if df.empty:
                 return df
                 
-            # 基本数据清理 - 确保日期列是Timestamp格式
-            df['日期'] = pd.to_datetime(df['日期'])
+            # 基本数据清理 - 缓存和接口数据的日期列均已是Timestamp格式，只需保证排序
             df = df.sort_values('日期').reset_index(drop=True)
             
             # 标准化列名，确保一致性
@@ -141,32 +330,111 @@ class DataHandler:
                 # 指数数据可能没有股票代码列，需要添加
                 df['股票代码'] = symbol
             
+            # 代码列每行取值相同，使用分类类型避免逐行保存Python字符串对象
+            if '股票代码' in df.columns:
+                df['股票代码'] = df['股票代码'].astype('category')
+            
             return df
             
         except Exception as e:
             raise Exception(f"获取证券数据失败: {str(e)}")
     
+    def _fetch_from_api(self, api_name: str, api_kwargs: Dict, symbol: str, start_date: str) -> pd.DataFrame:
+        """
+        调用akshare接口获取证券历史数据
+        
+        Args:
+            api_name: akshare接口函数名
+            api_kwargs: 接口的附加参数
+            symbol: 证券代码
+            start_date: 起始日期，格式为YYYYMMDD
+            
+        Returns:
+            接口返回的DataFrame
+        """
+        import akshare as ak
+        
+        return getattr(ak, api_name)(symbol=symbol, start_date=start_date, **api_kwargs)
+    
+    def _read_cached_data(self, folder: str, symbol: str) -> Optional[pd.DataFrame]:
+        """
+        读取本地缓存的证券数据
+        
+        优先读取Feather格式缓存（保留列类型，无需重新解析日期）；
+        若只存在旧版CSV缓存，则读取CSV并解析日期，下次写入时自动迁移为Feather。
+        
+        Args:
+            folder: 缓存文件夹
+            symbol: 证券代码
+            
+        Returns:
+            缓存的DataFrame，不存在缓存时返回None
+        """
+        feather_path = f'{folder}/{symbol}.feather'
+        if os.path.exists(feather_path):
+            return pd.read_feather(feather_path)
+        
+        csv_path = f'{folder}/{symbol}.csv'
+        if os.path.exists(csv_path):
+            df = pd.read_csv(csv_path)
+            df['日期'] = pd.to_datetime(df['日期'])
+            return df
+        
+        return None
+    
+    def _write_cached_data(self, df: pd.DataFrame, file_path: str) -> None:
+        """
+        以Feather格式写入证券数据缓存
+        
+        先写入临时文件再原子替换，避免写入中断导致缓存文件损坏。
+        
+        Args:
+            df: 证券数据DataFrame
+            file_path: 缓存文件路径
+        """
+        df = df.reset_index(drop=True)
+        float_columns = {col: 'float64' for col in CACHE_FLOAT_COLUMNS if col in df.columns}
+        df = df.astype({'日期': 'datetime64[ns]', **float_columns})
+        
+        _write_feather_atomic(df, file_path)
+    
     def calculate_cumulative_vwap(self, df: pd.DataFrame, input_date: Dict) -> pd.DataFrame:
-        """计算KDAS（累计成交量加权平均价格）"""
-        df = df.copy()
-        df['日期'] = pd.to_datetime(df['日期'])
-        
-        for key, value in input_date.items():
-            target_date = datetime.strptime(value, "%Y%m%d").date()
-            start_idx = df[df['日期'].dt.date == target_date].index
-            if len(start_idx) > 0:
-                start_idx = start_idx[0]
-                # 初始化列为NaN
-                df[f'累计成交额{value}'] = pd.Series(dtype=float)
-                df[f'累计成交量{value}'] = pd.Series(dtype=float)
-                df[f'KDAS{value}'] = pd.Series(dtype=float)
-                
-                # 只对从start_idx开始的行进行累计计算
-                df.loc[start_idx:, f'累计成交额{value}'] = df.loc[start_idx:, '成交额'].cumsum()
-                df.loc[start_idx:, f'累计成交量{value}'] = df.loc[start_idx:, '成交量'].cumsum()
-                df.loc[start_idx:, f'KDAS{value}'] = (df.loc[start_idx:, f'累计成交额{value}'] / df.loc[start_idx:, f'累计成交量{value}'] / 100).round(3)
+        """计算KDAS（累计成交量加权平均价格），要求数据按日期升序排列"""
+        dates = df['日期']
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates)
+            df = df.assign(日期=dates)
+        dates_i8 = dates.dt.normalize().to_numpy(dtype='datetime64[ns]').view('i8')
+        # 相同的起始日期对应同一组KDAS列，去重后只计算一次
+        date_values = list(dict.fromkeys(input_date.values()))
+        anchor_i8 = _compact_dates_to_days(date_values).astype('datetime64[ns]').view('i8')
+        
+        kdas_results = _kdas_core(
+            dates_i8,
+            df['成交额'].to_numpy(dtype=np.float64),
+            df['成交量'].to_numpy(dtype=np.float64),
+            anchor_i8
+        )
+        
+        new_cols = {}
+        for k, (cum_amount, cum_volume, kdas) in kdas_results.items():
+            value = date_values[k]
+            new_cols[f'累计成交额{value}'] = cum_amount
+            new_cols[f'累计成交量{value}'] = cum_volume
+            # 在float64下按3位小数取整后再降为float32
+            new_cols[f'KDAS{value}'] = np.round(kdas, 3).astype(np.float32)
+        
+        # 新列一次性拼接到原数据之后，不复制原DataFrame
+        # 累计成交额/成交量可达1e11以上，超出float32约7位有效数字的精度，保持float64；
+        # 只有KDAS列降为float32以减少内存占用
+        kdas_frame = pd.DataFrame(new_cols, index=df.index)
         
-        return df
+        # 重复计算相同起始日期时替换已有的KDAS列
+        existing = [col for col in new_cols if col in df.columns]
+        if existing:
+            df = df.drop(columns=existing)
+        
+        return pd.concat([df, kdas_frame], axis=1)
 
     async def batch_get_securities_data(self, securities_list: List[Dict]) -> List[Dict]:
         """
@@ -239,7 +507,7 @@ class DataHandler:
             证券数据DataFrame
         """
         # 将同步的数据获取函数在线程池中执行，避免阻塞事件循环
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         return await loop.run_in_executor(
             None, 
             self.get_security_data, 
@@ -308,17 +576,31 @@ class DataHandler:
             }
         
         validated_dates = {}
-        df_dates = df['日期'].dt.strftime('%Y%m%d').tolist()
+        # 交易日转换为int64天数，成员判断和距离计算都在整数上完成
+        df_days = np.sort(df['日期'].values.astype('datetime64[D]').astype('int64'))
+        df_day_set = frozenset(df_days.tolist())
+        target_days = dict(zip(
+            input_dates.keys(),
+            _compact_dates_to_days(list(input_dates.values())).astype('int64').tolist()
+        ))
+        misses = [key for key, day in target_days.items() if day not in df_day_set]
+        
+        closest_dates = {}
+        if misses:
+            # 对不在数据中的日期，用二分查找在有序交易日中寻找最接近的日期
+            targets = np.array([target_days[key] for key in misses], dtype=np.int64)
+            pos = df_days.searchsorted(targets)
+            left = np.clip(pos - 1, 0, len(df_days) - 1)
+            right = np.clip(pos, 0, len(df_days) - 1)
+            closest = np.where(
+                np.abs(targets - df_days[left]) <= np.abs(df_days[right] - targets),
+                left, right
+            )
+            closest_strs = np.datetime_as_string(df_days[closest].astype('datetime64[D]'))
+            closest_dates = {key: date.replace('-', '') for key, date in zip(misses, closest_strs)}
         
         for key, date_str in input_dates.items():
-            if date_str in df_dates:
-                validated_dates[key] = date_str
-            else:
-                # 寻找最接近的日期
-                target_date = datetime.strptime(date_str, '%Y%m%d')
-                available_dates = [datetime.strptime(d, '%Y%m%d') for d in df_dates]
-                closest_date = min(available_dates, key=lambda x: abs((x - target_date).days))
-                validated_dates[key] = closest_date.strftime('%Y%m%d')
+            validated_dates[key] = closest_dates.get(key, date_str)
         
         return {
             'valid': True,
@@ -1,9 +1,147 @@
-from openai import OpenAI, AsyncOpenAI
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import json
-from typing import Dict
+import asyncio
+import functools
+from typing import Dict, List, AsyncIterator
+from .llm_client import (
+    get_shared_sync_client, get_shared_async_client,
+    get_llm_concurrency, get_loop_semaphore, get_max_output_tokens, throttle_llm_request, LLM_COMPLETION_TIMEOUT
+)
+from .response_cache import ResponseCache
+from .utils import dumps_json
+from ._njit import njit
+
+
+# KDAS交易体系理论框架，每次分析都相同，放在system消息中使各次请求共享相同的前缀，便于服务端prompt缓存
+KDAS_FRAMEWORK_PROMPT = """
+KDAS交易体系理论框架：
+
+核心内容：四种状态的KDAS
+关键词：多空力量平衡、趋势确认、情绪宣泄、市场一致性
+
+支持判断、协助制定策略"关键位"，只采用趋势单：
+- 从下方升到KDAS均线以上时，只做多KDAS分时强点
+- 从上方跌到KDAS均线下方时，只做空KDAS分时强点
+
+一、趋势行进状态
+1. 趋势确认：当前价格在KDAS线上方（多）或下方（空），且均线发散，方向一致
+2. 高位/低位蓄能：价格仍在KDAS均线上方，但均线开始收拢，价格横盘震荡
+
+二、趋势衰竭状态  
+1. 情绪宣泄：价格脱离KDAS线出现极端运行，多空力量临时失衡
+2. 趋势反转：出现明显背离/结构破坏，KDAS均线系统掉头
+
+三、趋势衰竭后的震荡状态
+1. 多空力量一致：市场整体节奏一致，无明显分歧
+2. 多空分歧剧烈：市场内部观点分歧剧烈，多空反复试探
+
+四、整理状态
+1. 情绪积累：无量波动、价格震荡，市场预期累积
+2. 整体盘整：KDAS系统失去方向性，价格围绕中轴反复运行
+"""
+
+# 用户消息中证券数据段落的标题
+KDAS_DATA_HEADER = """当前证券分析数据：
+
+"""
+
+# 分析要求和JSON输出格式说明
+KDAS_OUTPUT_INSTRUCTIONS = """请基于KDAS交易体系理论，深度分析当前市场状态，用专业但易懂的语言进行分析，帮助投资者更好地理解当前市场状态，以JSON格式返回你的结果：
+```json
+{
+    "状态": "当前KD判断当前属于上述四种状态中的哪一种，并详细说明判断依据AS状态",
+    "多空力量分析": "分析当前多空力量对比，以及价格与KDAS系统的位置关系",
+    "趋势方向判断": "基于KDAS系统判断当前趋势方向和强度",
+    "交易建议": "根据KDAS体系给出具体的交易策略建议",
+    "风险提示": "基于当前状态的风险评估和注意事项",
+    "置信度": "以上分析的回答置信度，从高到低分为：高、中、低"
+}
+```
+"""
+
+# 多证券合并请求时的分析要求和JSON输出格式说明
+KDAS_BATCH_OUTPUT_INSTRUCTIONS = """请基于KDAS交易体系理论，分别深度分析以上每只证券的当前市场状态，用专业但易懂的语言进行分析，以JSON格式返回你的结果，results中每只证券一项，"代码"必须与上面给出的证券代码一致：
+```json
+{
+    "results": [
+        {
+            "代码": "证券代码",
+            "状态": "判断当前属于上述四种状态中的哪一种，并详细说明判断依据",
+            "多空力量分析": "分析当前多空力量对比，以及价格与KDAS系统的位置关系",
+            "趋势方向判断": "基于KDAS系统判断当前趋势方向和强度",
+            "交易建议": "根据KDAS体系给出具体的交易策略建议",
+            "风险提示": "基于当前状态的风险评估和注意事项",
+            "置信度": "以上分析的回答置信度，从高到低分为：高、中、低"
+        }
+    ]
+}
+```
+"""
+
+# 合并请求时每次LLM调用最多包含的证券数量，实际数量还受模型max_tokens上限约束
+KDAS_BATCH_SIZE = 8
+
+# 每只证券的分析结果预留的输出token数
+KDAS_TOKENS_PER_SECURITY = 2000
+
+
+@functools.lru_cache(maxsize=8)
+def _kdas_system_prompt(model: str) -> str:
+    """
+    生成KDAS状态分析的system消息，同一模型的system消息只拼接一次
+    
+    Args:
+        model: AI模型名称
+        
+    Returns:
+        包含角色说明和KDAS理论框架的system消息
+    """
+    return (
+        f"你是一位专业的股票技术分析师，精通KDAS交易体系。当前使用的AI模型是{model}。"
+        f"请基于用户提供的KDAS数据对当前市场状态进行深度分析，确保回复格式严格按照JSON格式。\n{KDAS_FRAMEWORK_PROMPT}"
+    )
+
+
+@njit(cache=True)
+def _kdas_stats(latest_values: np.ndarray, current_price: float, recent_close: np.ndarray, recent_volume: np.ndarray):
+    """
+    一次遍历计算KDAS状态分析所需的统计量
+    
+    Args:
+        latest_values: 各KDAS均线的最新值
+        current_price: 当前价格
+        recent_close: 最近的收盘价数组
+        recent_volume: 最近的成交量数组
+        
+    Returns:
+        (支撑位, 压力位, KDAS离散度, 价格上方均线数, 价格下方均线数,
+         平均成交量, 成交量是否放大, 价格波动率, 价格是否上涨) 元组
+    """
+    below = latest_values[latest_values < current_price]
+    above = latest_values[latest_values > current_price]
+    support = np.sort(below)[::-1][:3]  # 最近3个支撑位，从高到低
+    resistance = np.sort(above)[:3]  # 最近3个压力位，从低到高
+    dispersion = latest_values.std() if latest_values.size > 1 else 0.0
+    
+    # 与pandas的mean/std一致，均值和标准差只统计非NaN的值
+    volume_valid = recent_volume[~np.isnan(recent_volume)]
+    volume_avg = volume_valid.mean() if volume_valid.size > 0 else np.nan
+    
+    # 样本标准差（ddof=1）
+    close_valid = recent_close[~np.isnan(recent_close)]
+    n = close_valid.size
+    if n > 1:
+        deviation = close_valid - close_valid.mean()
+        volatility = np.sqrt((deviation * deviation).sum() / (n - 1))
+    else:
+        volatility = np.nan
+    
+    return (
+        support, resistance, dispersion, above.size, below.size,
+        volume_avg, recent_volume[-1] > volume_avg, volatility, recent_close[-1] > recent_close[0]
+    )
 
 
 class KDASAnalyzer:
@@ -19,12 +157,21 @@ class KDASAnalyzer:
         """
         self.api_key = api_key
         self.model = model
-        if self.api_key:
-            self.client = OpenAI(api_key=self.api_key, base_url="https://chatwithai.icu/v1")
-            self.async_client = AsyncOpenAI(api_key=self.api_key, base_url="https://chatwithai.icu/v1")
-        else:
-            self.client = None
-            self.async_client = None
+        self.response_cache = ResponseCache()
+        # 使用进程内按(api_key, base_url)共享的同步客户端，多个实例复用同一批keep-alive连接
+        self.client = get_shared_sync_client(self.api_key) if self.api_key else None
+        
+        # LLM并发信号量按事件循环分别懒创建：同一实例可能被不同线程中的多个事件循环同时使用
+        self._llm_concurrency = get_llm_concurrency()
+
+    @property
+    def async_client(self):
+        """当前事件循环共享的异步客户端，每次访问时按运行中的事件循环获取，未配置密钥时为None"""
+        return get_shared_async_client(self.api_key) if self.api_key else None
+
+    def _get_llm_semaphore(self) -> asyncio.Semaphore:
+        """获取当前事件循环下限制LLM并发请求数的信号量，普通请求和流式请求共用"""
+        return get_loop_semaphore(self, self._llm_concurrency)
 
     def analyze_kdas_state(self, df: pd.DataFrame, input_dates: Dict, symbol: str, security_name: str, security_type: str) -> Dict:
         """
@@ -92,8 +239,11 @@ class KDASAnalyzer:
             }
         
         try:
-            # 准备KDAS状态分析数据
-            analysis_data = self._prepare_kdas_analysis_data(df, input_dates, symbol, security_name, security_type)
+            # 准备KDAS状态分析数据 - 在线程池中计算，避免阻塞事件循环中其他证券的LLM请求
+            loop = asyncio.get_running_loop()
+            analysis_data = await loop.run_in_executor(
+                None, self._prepare_kdas_analysis_data, df, input_dates, symbol, security_name, security_type
+            )
             
             # 准备KDAS分析prompt
             prompt = self._prepare_kdas_analysis_prompt(analysis_data)
@@ -114,53 +264,175 @@ class KDASAnalyzer:
                 'analysis': f'异步分析过程中出现错误: {str(e)}'
             }
 
+    async def analyze_kdas_state_stream(self, df: pd.DataFrame, input_dates: Dict, symbol: str, security_name: str, security_type: str) -> AsyncIterator[str]:
+        """
+        流式分析当前KDAS交易状态，逐段产出模型回复，便于界面边生成边展示
+        
+        Args:
+            df: 包含KDAS计算结果的DataFrame
+            input_dates: KDAS计算起始日期字典
+            symbol: 证券代码
+            security_name: 证券名称
+            security_type: 证券类型
+            
+        Yields:
+            模型回复的文本片段，拼接后与analyze_kdas_state_async返回的analysis一致
+        """
+        if not self.api_key:
+            raise Exception('AI API密钥未配置')
+        
+        loop = asyncio.get_running_loop()
+        analysis_data = await loop.run_in_executor(
+            None, self._prepare_kdas_analysis_data, df, input_dates, symbol, security_name, security_type
+        )
+        prompt = self._prepare_kdas_analysis_prompt(analysis_data)
+        
+        async for chunk in self._call_llm_stream(prompt):
+            yield chunk
+
+    async def analyze_many_async(self, inputs: List[Dict], max_concurrency: int = None) -> List[Dict]:
+        """
+        并发分析多个证券的KDAS交易状态
+        
+        Args:
+            inputs: 参数字典列表，每个字典包含df、input_dates、symbol、security_name、security_type
+            max_concurrency: 同时进行的LLM请求数量上限，默认使用KDAS_LLM_CONCURRENCY配置
+            
+        Returns:
+            与inputs顺序一致的KDAS状态分析结果列表
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or get_llm_concurrency())
+        
+        async def run(params: Dict) -> Dict:
+            async with semaphore:
+                return await self.analyze_kdas_state_async(**params)
+        
+        return await asyncio.gather(*(run(params) for params in inputs))
+
+    async def analyze_kdas_state_batch(self, inputs: List[Dict], batch_size: int = None, max_concurrency: int = None) -> List[Dict]:
+        """
+        将多只证券合并到同一次LLM请求中分析KDAS交易状态，各批次之间并发执行
+        
+        Args:
+            inputs: 参数字典列表，每个字典包含df、input_dates、symbol、security_name、security_type
+            batch_size: 每次LLM请求包含的证券数量，默认为KDAS_BATCH_SIZE；
+                超过模型max_tokens上限能容纳的数量时自动减小
+            max_concurrency: 同时进行的LLM请求数量上限，默认使用KDAS_LLM_CONCURRENCY配置
+            
+        Returns:
+            与inputs顺序一致的KDAS状态分析结果列表
+        """
+        if not self.api_key:
+            return [{
+                'success': False,
+                'error': 'AI API密钥未配置',
+                'analysis': '需要配置AI API密钥才能使用KDAS状态分析功能'
+            } for _ in inputs]
+        
+        # 每只证券预留KDAS_TOKENS_PER_SECURITY个输出token，批次大小不超过模型上限能容纳的数量
+        max_output_tokens = get_max_output_tokens(self.model)
+        batch_size = max(1, min(batch_size or KDAS_BATCH_SIZE, max_output_tokens // KDAS_TOKENS_PER_SECURITY))
+        
+        semaphore = asyncio.Semaphore(max_concurrency or get_llm_concurrency())
+        loop = asyncio.get_running_loop()
+        
+        def prepare(batch: List[Dict]) -> List[Dict]:
+            return [self._prepare_kdas_analysis_data(**params) for params in batch]
+        
+        async def run(batch: List[Dict]) -> List[Dict]:
+            try:
+                analysis_data_list = await loop.run_in_executor(None, prepare, batch)
+                prompt = self._prepare_kdas_batch_prompt(analysis_data_list)
+                async with semaphore:
+                    response = await self._call_llm_async(
+                        prompt, max_tokens=min(KDAS_TOKENS_PER_SECURITY * len(batch), max_output_tokens)
+                    )
+                results_by_symbol = self._split_batch_response(response)
+            except Exception as e:
+                return [{
+                    'success': False,
+                    'error': f'批量KDAS状态分析失败: {str(e)}',
+                    'analysis': f'批量分析过程中出现错误: {str(e)}'
+                } for _ in batch]
+            
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            batch_results = []
+            for params in batch:
+                item = results_by_symbol.get(str(params['symbol']))
+                if item is None:
+                    batch_results.append({
+                        'success': False,
+                        'error': f"批量KDAS状态分析结果中缺少证券{params['symbol']}",
+                        'analysis': '模型回复中未包含该证券的分析结果'
+                    })
+                else:
+                    batch_results.append({
+                        'success': True,
+                        'analysis': json.dumps(item, ensure_ascii=False, indent=2),
+                        'timestamp': timestamp
+                    })
+            return batch_results
+        
+        batches = [inputs[i:i + batch_size] for i in range(0, len(inputs), batch_size)]
+        batch_results = await asyncio.gather(*(run(batch) for batch in batches))
+        return [result for results in batch_results for result in results]
+
+    def _split_batch_response(self, response: str) -> Dict[str, Dict]:
+        """解析合并请求的回复，按证券代码拆分各自的分析结果"""
+        json_start = response.find('{')
+        json_end = response.rfind('}') + 1
+        if json_start == -1 or json_end == 0:
+            raise ValueError('回复中未找到JSON内容')
+        
+        results = json.loads(response[json_start:json_end]).get('results', [])
+        return {str(item.get('代码')): item for item in results if isinstance(item, dict)}
+
     def _prepare_kdas_analysis_data(self, df: pd.DataFrame, input_dates: Dict, symbol: str, security_name: str, security_type: str) -> Dict:
         """准备KDAS状态分析所需的数据"""
         if df.empty:
             return {}
         
-        # 获取最新数据
-        latest_data = df.tail(10)  # 最近10个交易日
-        current_price = float(df['收盘'].iloc[-1])
+        # 一次性取出底层数组，后续索引和统计直接在NumPy上进行
+        close = df['收盘'].to_numpy(dtype=np.float64)
+        volume = df['成交量'].to_numpy(dtype=np.float64)
+        recent_close = close[-10:]  # 最近10个交易日
+        recent_volume = volume[-10:]
+        current_price = float(close[-1])
         
-        # 计算KDAS相关数据
+        # 计算KDAS相关数据：所有KDAS列一次性取成二维数组，按列向量化定位最新值
         kdas_info = {}
-        support_levels = []  # 支撑位
-        resistance_levels = []  # 压力位
-        
-        for key, date_str in input_dates.items():
-            kdas_col = f'KDAS{date_str}'
-            if kdas_col in df.columns:
-                kdas_series = df[kdas_col].dropna()
-                if not kdas_series.empty:
-                    latest_kdas = float(kdas_series.iloc[-1])
+        kdas_items = [(key, date_str) for key, date_str in input_dates.items() if f'KDAS{date_str}' in df.columns]
+        latest_values = np.empty(0, dtype=np.float64)
+        
+        if kdas_items:
+            # 多个关键日期相同时共用同一KDAS列，只对不重复的列计算一次，再按inverse展开回各关键日期
+            unique_dates, inverse = np.unique([date_str for _, date_str in kdas_items], return_inverse=True)
+            kdas_matrix = df[[f'KDAS{date_str}' for date_str in unique_dates]].to_numpy(dtype=np.float64)[::-1]
+            # 自尾部起累计的非空值个数，据此定位每列最后一个和倒数第6个非空值
+            tail_counts = np.cumsum(~np.isnan(kdas_matrix), axis=0)
+            num_valid = tail_counts[-1]
+            columns = np.arange(len(unique_dates))
+            # KDAS列以float32保存，取出的值按计算时的3位小数重新取整，还原为原始价格
+            latest = np.round(kdas_matrix[np.argmax(tail_counts >= 1, axis=0), columns], 3)
+            previous = np.round(kdas_matrix[np.argmax(tail_counts >= 6, axis=0), columns], 3)
+            has_value = (num_valid > 0)[inverse]
+            rising = ((num_valid > 5) & (latest > previous))[inverse]
+            latest = latest[inverse]
+            
+            for (key, date_str), value, is_rising, valid in zip(kdas_items, latest.tolist(), rising.tolist(), has_value.tolist()):
+                if valid:
                     kdas_info[key] = {
-                        'value': latest_kdas,
+                        'value': value,
                         'start_date': datetime.strptime(date_str, '%Y%m%d').strftime('%Y-%m-%d'),
-                        'trend': 'up' if len(kdas_series) > 5 and kdas_series.iloc[-1] > kdas_series.iloc[-6] else 'down'
+                        'trend': 'up' if is_rising else 'down'
                     }
-                    
-                    # 分类支撑位和压力位
-                    if latest_kdas < current_price:
-                        support_levels.append(latest_kdas)
-                    elif latest_kdas > current_price:
-                        resistance_levels.append(latest_kdas)
-        
-        # 支撑位和压力位排序
-        support_levels.sort(reverse=True)  # 支撑位从高到低
-        resistance_levels.sort()  # 压力位从低到高
-        
-        # 成交量分析
-        recent_volume = latest_data['成交量'].mean()
-        volume_trend = 'increasing' if latest_data['成交量'].iloc[-1] > recent_volume else 'decreasing'
+            latest_values = latest[has_value]
         
-        # 价格波动分析
-        price_volatility = float(latest_data['收盘'].std())
-        price_trend = 'up' if latest_data['收盘'].iloc[-1] > latest_data['收盘'].iloc[0] else 'down'
-        
-        # KDAS均线发散/收敛分析
-        kdas_values = [info['value'] for info in kdas_info.values()]
-        kdas_dispersion = float(np.std(kdas_values)) if len(kdas_values) > 1 else 0
+        # 支撑压力位、成交量、价格波动及KDAS离散度统计在JIT内核中一次完成
+        (support, resistance, kdas_dispersion, num_above, num_below,
+         recent_volume_avg, volume_rising, price_volatility, price_rising) = _kdas_stats(
+            latest_values, current_price, recent_close, recent_volume
+        )
         
         return {
             'security_info': {
@@ -171,27 +443,40 @@ class KDASAnalyzer:
                 'data_period': f"{df['日期'].iloc[0].strftime('%Y-%m-%d')} 至 {df['日期'].iloc[-1].strftime('%Y-%m-%d')}"
             },
             'kdas_info': kdas_info,
-            'support_levels': support_levels[:3],  # 最近3个支撑位
-            'resistance_levels': resistance_levels[:3],  # 最近3个压力位
+            'support_levels': support.tolist(),
+            'resistance_levels': resistance.tolist(),
             'market_data': {
-                'recent_volume_avg': float(recent_volume),
-                'volume_trend': volume_trend,
-                'price_volatility': price_volatility,
-                'price_trend': price_trend,
-                'latest_volume': float(latest_data['成交量'].iloc[-1]),
-                'latest_high': float(latest_data['最高'].iloc[-1]),
-                'latest_low': float(latest_data['最低'].iloc[-1])
+                'recent_volume_avg': float(recent_volume_avg),
+                'volume_trend': 'increasing' if volume_rising else 'decreasing',
+                'price_volatility': float(price_volatility),
+                'price_trend': 'up' if price_rising else 'down',
+                'latest_volume': float(volume[-1]),
+                'latest_high': float(df['最高'].iat[-1]),
+                'latest_low': float(df['最低'].iat[-1])
             },
             'kdas_system': {
-                'dispersion': kdas_dispersion,
+                'dispersion': float(kdas_dispersion) if latest_values.size > 1 else 0,
                 'convergence_status': 'converging' if kdas_dispersion < current_price * 0.01 else 'diverging',
-                'num_above_price': len([k for k in kdas_values if k > current_price]),
-                'num_below_price': len([k for k in kdas_values if k < current_price])
+                'num_above_price': int(num_above),
+                'num_below_price': int(num_below)
             }
         }
 
     def _prepare_kdas_analysis_prompt(self, analysis_data: Dict) -> str:
         """准备KDAS状态分析的prompt"""
+        return ''.join([KDAS_DATA_HEADER, *self._format_security_section(analysis_data), KDAS_OUTPUT_INSTRUCTIONS])
+
+    def _prepare_kdas_batch_prompt(self, analysis_data_list: List[Dict]) -> str:
+        """准备多只证券合并分析的prompt，理论框架在system消息中只出现一次"""
+        parts = [KDAS_DATA_HEADER]
+        for i, analysis_data in enumerate(analysis_data_list, 1):
+            parts.append(f"【证券{i}】\n")
+            parts.extend(self._format_security_section(analysis_data))
+        parts.append(KDAS_BATCH_OUTPUT_INSTRUCTIONS)
+        return ''.join(parts)
+
+    def _format_security_section(self, analysis_data: Dict) -> List[str]:
+        """格式化单只证券的分析数据段落"""
         
         security_info = analysis_data.get('security_info', {})
         kdas_info = analysis_data.get('kdas_info', {})
@@ -200,37 +485,7 @@ class KDASAnalyzer:
         market_data = analysis_data.get('market_data', {})
         kdas_system = analysis_data.get('kdas_system', {})
         
-        prompt = f"""
-你是一位精通KDAS交易体系的专业技术分析师，请基于以下数据对当前市场状态进行深度分析。
-
-KDAS交易体系理论框架：
-
-核心内容：四种状态的KDAS
-关键词：多空力量平衡、趋势确认、情绪宣泄、市场一致性
-
-支持判断、协助制定策略"关键位"，只采用趋势单：
-- 从下方升到KDAS均线以上时，只做多KDAS分时强点
-- 从上方跌到KDAS均线下方时，只做空KDAS分时强点
-
-一、趋势行进状态
-1. 趋势确认：当前价格在KDAS线上方（多）或下方（空），且均线发散，方向一致
-2. 高位/低位蓄能：价格仍在KDAS均线上方，但均线开始收拢，价格横盘震荡
-
-二、趋势衰竭状态  
-1. 情绪宣泄：价格脱离KDAS线出现极端运行，多空力量临时失衡
-2. 趋势反转：出现明显背离/结构破坏，KDAS均线系统掉头
-
-三、趋势衰竭后的震荡状态
-1. 多空力量一致：市场整体节奏一致，无明显分歧
-2. 多空分歧剧烈：市场内部观点分歧剧烈，多空反复试探
-
-四、整理状态
-1. 情绪积累：无量波动、价格震荡，市场预期累积
-2. 整体盘整：KDAS系统失去方向性，价格围绕中轴反复运行
-
-当前证券分析数据：
-
-证券基本信息：
+        parts = [f"""证券基本信息：
 - 名称：{security_info.get('name', '未知')}
 - 代码：{security_info.get('symbol', '未知')}
 - 类型：{security_info.get('type', '未知')}
@@ -238,95 +493,197 @@ KDAS交易体系理论框架：
 - 数据周期：{security_info.get('data_period', '未知')}
 
 KDAS系统状态：
-"""
+"""]
         
         # 添加KDAS详细信息
-        for key, info in kdas_info.items():
-            prompt += f"- {key}: ¥{info['value']:.3f} (起始日期: {info['start_date']}, 趋势: {info['trend']})\n"
+        parts.extend(
+            f"- {key}: ¥{info['value']:.3f} (起始日期: {info['start_date']}, 趋势: {info['trend']})\n"
+            for key, info in kdas_info.items()
+        )
         
-        prompt += f"""
+        parts.append(f"""
 支撑压力位分析：
-- 主要支撑位：{[f'¥{level:.3f}' for level in support_levels]}
-- 主要压力位：{[f'¥{level:.3f}' for level in resistance_levels]}
-
-市场数据：
-- 最新成交量：{market_data.get('latest_volume', 0):,.0f}
-- 近期平均成交量：{market_data.get('recent_volume_avg', 0):,.0f}
-- 成交量趋势：{market_data.get('volume_trend', '未知')}
-- 价格波动率：{market_data.get('price_volatility', 0):.3f}
-- 价格趋势：{market_data.get('price_trend', '未知')}
-
-KDAS系统特征：
-- 均线发散度：{kdas_system.get('dispersion', 0):.3f}
-- 收敛状态：{kdas_system.get('convergence_status', '未知')}
-- 价格上方KDAS数量：{kdas_system.get('num_above_price', 0)}
-- 价格下方KDAS数量：{kdas_system.get('num_below_price', 0)}
-
-请基于KDAS交易体系理论，深度分析当前市场状态，用专业但易懂的语言进行分析，帮助投资者更好地理解当前市场状态，以JSON格式返回你的结果：
+- 主要支撑位：{self._format_levels(support_levels)}
+- 主要压力位：{self._format_levels(resistance_levels)}
+
+市场数据与KDAS系统特征：
 ```json
-{{
-    "状态": "当前KD判断当前属于上述四种状态中的哪一种，并详细说明判断依据AS状态",
-    "多空力量分析": "分析当前多空力量对比，以及价格与KDAS系统的位置关系",
-    "趋势方向判断": "基于KDAS系统判断当前趋势方向和强度",
-    "交易建议": "根据KDAS体系给出具体的交易策略建议",
-    "风险提示": "基于当前状态的风险评估和注意事项",
-    "置信度": "以上分析的回答置信度，从高到低分为：高、中、低"
-}}
+{dumps_json({'market_data': market_data, 'kdas_system': kdas_system})}
 ```
-"""
+
+""")
         
-        return prompt
+        return parts
+
+    @staticmethod
+    def _format_levels(levels: List[float]) -> str:
+        """将价位列表格式化为以顿号分隔的价格文本，没有价位时返回“无”"""
+        return '、'.join(f'¥{level:.3f}' for level in levels) or '无'
+
+    def _build_messages(self, prompt: str) -> list:
+        """构建LLM请求消息，固定的理论框架放在system消息中，user消息只包含证券数据和输出要求"""
+        return [
+            {
+                "role": "system", 
+                "content": _kdas_system_prompt(self.model)
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+
+    def _cache_response(self, cache_key: str, content: str) -> None:
+        """
+        缓存可解析的回复；推理模型只输出思考过程或回复被截断时得到的空文本、残缺JSON不写入缓存，
+        避免同一prompt在缓存有效期内一直返回无效结果
+        
+        Args:
+            cache_key: 缓存键
+            content: 模型回复文本
+        """
+        if not content:
+            return
+        json_start = content.find('{')
+        json_end = content.rfind('}') + 1
+        if json_start == -1 or json_end <= json_start:
+            return
+        try:
+            json.loads(content[json_start:json_end])
+        except ValueError:
+            return
+        self.response_cache.set(cache_key, content)
 
     def _call_llm(self, prompt: str) -> str:
-        """调用大语言模型"""
+        """调用大语言模型，相同模型和prompt的回复直接从缓存读取"""
         try:
             if not self.client:
                 raise Exception("OpenAI客户端未初始化")
+            
+            messages = self._build_messages(prompt)
+            cache_key = ResponseCache.make_key(self.model, messages)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
                 
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": f"你是一位专业的股票技术分析师，精通KDAS交易体系。当前使用的AI模型是{self.model}。请基于KDAS数据给出专业的状态分析，确保回复格式严格按照JSON格式。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+                messages=messages,
                 max_tokens=2000,
-                temperature=0.3
+                temperature=0.3,
+                timeout=LLM_COMPLETION_TIMEOUT
             )
             
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            self._cache_response(cache_key, content)
+            return content
             
         except Exception as e:
             raise Exception(f"KDAS分析GPT调用失败: {str(e)}")
     
-    async def _call_llm_async(self, prompt: str) -> str:
-        """异步调用大语言模型"""
+    async def _call_llm_async(self, prompt: str, max_tokens: int = 2000) -> str:
+        """异步调用大语言模型，相同模型和prompt的回复直接从缓存读取"""
         try:
-            if not self.async_client:
+            async_client = self.async_client
+            if not async_client:
                 raise Exception("异步OpenAI客户端未初始化")
+            
+            messages = self._build_messages(prompt)
+            cache_key = ResponseCache.make_key(self.model, messages)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            async with self._get_llm_semaphore():
+                await throttle_llm_request()
+                # 流式接收回复：数据块持续到达，推理模型长时间生成时不会因等待完整回复触发读取超时
+                stream = await async_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.3,
+                    stream=True
+                )
                 
-            response = await self.async_client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": f"你是一位专业的股票技术分析师，精通KDAS交易体系。当前使用的AI模型是{self.model}。请基于KDAS数据给出专业的状态分析，确保回复格式严格按照JSON格式。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=2000,
-                temperature=0.3
-            )
+                chunks = []
+                try:
+                    async for event in stream:
+                        if not event.choices:
+                            continue
+                        content = event.choices[0].delta.content
+                        if content:
+                            chunks.append(content)
+                finally:
+                    await stream.close()
             
-            return response.choices[0].message.content
+            content = ''.join(chunks)
+            self._cache_response(cache_key, content)
+            return content
             
         except Exception as e:
-            raise Exception(f"异步KDAS分析GPT调用失败: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"异步KDAS分析GPT调用失败: {str(e)}")
+
+    async def _call_llm_stream(self, prompt: str) -> AsyncIterator[str]:
+        """流式调用大语言模型，完整回复在结束后写入缓存，命中缓存时一次性产出"""
+        async_client = self.async_client
+        if not async_client:
+            raise Exception("异步OpenAI客户端未初始化")
+        
+        messages = self._build_messages(prompt)
+        cache_key = ResponseCache.make_key(self.model, messages)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        # 信号量只在创建请求和读取流期间持有：后台任务把数据块读入队列，
+        # 向调用方产出时不占用并发名额，消费缓慢的调用方不会阻塞其他请求
+        queue = asyncio.Queue()
+        done = object()
+        
+        async def produce():
+            try:
+                async with self._get_llm_semaphore():
+                    await throttle_llm_request()
+                    stream = await async_client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=2000,
+                        temperature=0.3,
+                        stream=True
+                    )
+                    try:
+                        async for event in stream:
+                            if not event.choices:
+                                continue
+                            content = event.choices[0].delta.content
+                            if content:
+                                queue.put_nowait(content)
+                    finally:
+                        await stream.close()
+            except Exception as e:
+                queue.put_nowait(e)
+            else:
+                queue.put_nowait(done)
+        
+        chunks = []
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise Exception(f"流式KDAS分析GPT调用失败: {str(item)}")
+                chunks.append(item)
+                yield item
+        finally:
+            # 调用方提前停止迭代时取消后台任务，关闭流并释放连接和信号量
+            if not producer.done():
+                producer.cancel()
+                try:
+                    await producer
+                except asyncio.CancelledError:
+                    pass
+        
+        self._cache_response(cache_key, ''.join(chunks))
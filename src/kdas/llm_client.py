@@ -0,0 +1,341 @@
+import os
+import time
+import asyncio
+import threading
+import weakref
+import contextlib
+import contextvars
+import functools
+import importlib.util
+import httpx
+from openai import OpenAI, AsyncOpenAI, AuthenticationError
+
+
+# 默认的大语言模型API地址
+DEFAULT_BASE_URL = "https://chatwithai.icu/v1"
+
+# 遇到429限流或5xx错误时，openai SDK自动指数退避重试的次数
+LLM_MAX_RETRIES = 3
+
+# 单个引擎同时进行的LLM请求数量上限，可通过环境变量KDAS_LLM_CONCURRENCY调整
+DEFAULT_LLM_CONCURRENCY = 8
+
+# 每分钟LLM请求数上限，可通过环境变量KDAS_LLM_RATE_PER_MIN调整，为0时不限速
+DEFAULT_LLM_RATE_PER_MIN = 0
+
+# 各模型单次请求允许的max_tokens上限，按模型名前缀匹配，越具体的前缀越靠前
+MODEL_MAX_OUTPUT_TOKENS = (
+    ('gpt-4o', 16384),
+    ('gpt-4.1', 32768),
+    ('gpt-4-turbo', 4096),
+    ('gpt-4', 4096),
+    ('deepseek', 8192),
+)
+
+# 未知模型的max_tokens上限，可通过环境变量KDAS_LLM_MAX_OUTPUT_TOKENS统一调整
+DEFAULT_MAX_OUTPUT_TOKENS = 4096
+
+# HTTP连接池大小，连接数上限需不小于LLM并发上限
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+# 请求超时：整体60秒，建立连接10秒；流式请求的数据块持续到达，读取超时按相邻数据块的间隔计算
+HTTP_TIMEOUT = httpx.Timeout(60, connect=10)
+
+# 非流式请求的超时：推理模型生成完整回复常超过60秒，读取超时放宽到600秒（与openai SDK默认值一致），
+# 连接和连接池等待仍沿用HTTP_TIMEOUT的设置
+LLM_COMPLETION_TIMEOUT = httpx.Timeout(60, connect=10, read=600)
+
+# API密钥探测请求的超时（秒）
+API_KEY_PROBE_TIMEOUT = 5
+
+# API密钥探测结果的有效期（秒），过期后重新探测，使更换或恢复密钥后无需重启进程
+API_KEY_STATUS_TTL = 300
+
+# 安装了h2时才启用HTTP/2
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def get_llm_concurrency() -> int:
+    """获取LLM请求并发上限"""
+    return int(os.getenv('KDAS_LLM_CONCURRENCY', DEFAULT_LLM_CONCURRENCY))
+
+
+def get_max_output_tokens(model: str) -> int:
+    """
+    获取模型单次请求可以使用的max_tokens上限，超过上限的请求会被服务端以400拒绝
+    
+    Args:
+        model: AI模型名称
+        
+    Returns:
+        max_tokens上限，设置了环境变量KDAS_LLM_MAX_OUTPUT_TOKENS时以其为准
+    """
+    override = os.getenv('KDAS_LLM_MAX_OUTPUT_TOKENS')
+    if override:
+        return int(override)
+    name = (model or '').lower()
+    for prefix, limit in MODEL_MAX_OUTPUT_TOKENS:
+        if name.startswith(prefix):
+            return limit
+    return DEFAULT_MAX_OUTPUT_TOKENS
+
+
+class AsyncRateLimiter:
+    """异步请求限流器 - 按GCRA算法平滑放行，每分钟最多放行rate_per_min个请求"""
+    
+    def __init__(self, rate_per_min: float, burst: int = 1):
+        """
+        初始化限流器
+        
+        Args:
+            rate_per_min: 每分钟放行的请求数量
+            burst: 允许连续突发的请求数量
+        """
+        self.interval = 60.0 / rate_per_min
+        self.tolerance = (max(burst, 1) - 1) * self.interval
+        self._tat = 0.0
+        # 不同线程中的事件循环可能共用同一限流器，预约放行时刻时加锁
+        self._lock = threading.Lock()
+    
+    async def acquire(self) -> None:
+        """预约下一个放行时刻，未到该时刻时等待"""
+        with self._lock:
+            now = time.monotonic()
+            tat = max(self._tat, now)
+            self._tat = tat + self.interval
+        delay = tat - self.tolerance - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# 当前上下文指定的限流器，批量任务通过llm_rate_limit设置，其中创建的子任务自动继承
+_llm_rate_limiter = contextvars.ContextVar('kdas_llm_rate_limiter', default=None)
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_rate_limiter(rate_per_min: float) -> AsyncRateLimiter:
+    """按速率缓存的进程级限流器"""
+    return AsyncRateLimiter(rate_per_min)
+
+
+def get_llm_rate_limiter():
+    """
+    获取当前生效的LLM请求限流器
+    
+    优先使用llm_rate_limit为当前上下文指定的限流器，
+    其次使用环境变量KDAS_LLM_RATE_PER_MIN配置的进程级限流器
+    
+    Returns:
+        AsyncRateLimiter实例，不限速时返回None
+    """
+    limiter = _llm_rate_limiter.get()
+    if limiter is None:
+        rate_per_min = float(os.getenv('KDAS_LLM_RATE_PER_MIN', DEFAULT_LLM_RATE_PER_MIN))
+        if rate_per_min > 0:
+            limiter = _shared_rate_limiter(rate_per_min)
+    return limiter
+
+
+async def throttle_llm_request() -> None:
+    """发起LLM请求前调用，按当前生效的限流器等待放行"""
+    limiter = get_llm_rate_limiter()
+    if limiter is not None:
+        await limiter.acquire()
+
+
+@contextlib.contextmanager
+def llm_rate_limit(rate_per_min: float = None):
+    """
+    在当前上下文及其中创建的任务内按指定速率限制LLM请求
+    
+    Args:
+        rate_per_min: 每分钟LLM请求数上限，为空时沿用默认配置
+    """
+    if not rate_per_min:
+        yield
+        return
+    token = _llm_rate_limiter.set(AsyncRateLimiter(rate_per_min))
+    try:
+        yield
+    finally:
+        _llm_rate_limiter.reset(token)
+
+
+def create_async_http_client() -> httpx.AsyncClient:
+    """创建带持久连接池的异步HTTP客户端，复用连接避免每次请求重新进行TLS握手"""
+    return httpx.AsyncClient(limits=HTTP_POOL_LIMITS, http2=HTTP2_AVAILABLE, timeout=HTTP_TIMEOUT)
+
+
+def create_http_client() -> httpx.Client:
+    """创建带持久连接池的同步HTTP客户端"""
+    return httpx.Client(limits=HTTP_POOL_LIMITS, http2=HTTP2_AVAILABLE, timeout=HTTP_TIMEOUT)
+
+
+def create_clients(api_key: str, base_url: str = DEFAULT_BASE_URL):
+    """
+    创建同步和异步OpenAI客户端
+
+    Args:
+        api_key: AI API密钥
+        base_url: API地址
+
+    Returns:
+        (OpenAI, AsyncOpenAI) 客户端元组
+    """
+    return create_sync_client(api_key, base_url), create_async_client(api_key, base_url)
+
+
+def create_sync_client(api_key: str, base_url: str = DEFAULT_BASE_URL) -> OpenAI:
+    """创建带持久连接池的同步OpenAI客户端"""
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=create_http_client(),
+        max_retries=LLM_MAX_RETRIES
+    )
+
+
+def create_async_client(api_key: str, base_url: str = DEFAULT_BASE_URL) -> AsyncOpenAI:
+    """创建带持久连接池的异步OpenAI客户端"""
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=create_async_http_client(),
+        max_retries=LLM_MAX_RETRIES
+    )
+
+
+# 进程内共享的客户端：同步客户端按(api_key, base_url)缓存；
+# 异步客户端的连接池绑定在创建时的事件循环上，因此按事件循环分别缓存。
+# 客户端和信号量都持有其事件循环的强引用，事件循环不会被自动回收，
+# 需由事件循环的所有者在关闭事件循环前调用aclose_shared_clients释放；
+# 未释放就已关闭的事件循环在下次获取时从缓存中移除
+_shared_clients = {}
+_shared_async_clients = {}
+_loop_semaphores = {}
+_shared_clients_lock = threading.Lock()
+
+
+def _evict_closed_loops() -> None:
+    """移除已关闭事件循环的缓存条目，调用方需持有_shared_clients_lock"""
+    for cache in (_shared_async_clients, _loop_semaphores):
+        for loop in [loop for loop in cache if loop.is_closed()]:
+            del cache[loop]
+
+
+def get_shared_sync_client(api_key: str, base_url: str = DEFAULT_BASE_URL) -> OpenAI:
+    """获取进程内按(api_key, base_url)共享的同步OpenAI客户端，可在多个线程中同时使用"""
+    key = (api_key, base_url)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = _shared_clients[key] = create_sync_client(api_key, base_url)
+    return client
+
+
+def get_shared_async_client(api_key: str, base_url: str = DEFAULT_BASE_URL) -> AsyncOpenAI:
+    """
+    获取当前事件循环共享的异步OpenAI客户端
+    
+    异步客户端的连接池只能在创建它的事件循环中使用，因此调用方应在每次请求时获取，
+    而不是保存在可能被多个事件循环（如不同线程中的Streamlit会话）共用的对象上
+    
+    Args:
+        api_key: AI API密钥
+        base_url: API地址
+        
+    Returns:
+        当前事件循环的AsyncOpenAI客户端；没有运行中的事件循环时返回新建的实例
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return create_async_client(api_key, base_url)
+    
+    key = (api_key, base_url)
+    with _shared_clients_lock:
+        loop_clients = _shared_async_clients.get(loop)
+        if loop_clients is None:
+            _evict_closed_loops()
+            loop_clients = _shared_async_clients[loop] = {}
+        async_client = loop_clients.get(key)
+        if async_client is None:
+            async_client = loop_clients[key] = create_async_client(api_key, base_url)
+    return async_client
+
+
+def get_loop_semaphore(owner: object, limit: int) -> asyncio.Semaphore:
+    """
+    获取owner在当前事件循环上限制LLM并发请求数的信号量
+    
+    同一组件可能被不同线程中的多个事件循环同时使用，信号量按事件循环分别懒创建，
+    与共享客户端一起由aclose_shared_clients释放
+    
+    Args:
+        owner: 使用信号量的组件实例，组件被回收后其信号量随之释放
+        limit: 并发请求数上限
+        
+    Returns:
+        当前事件循环中owner的信号量
+    """
+    loop = asyncio.get_running_loop()
+    with _shared_clients_lock:
+        loop_semaphores = _loop_semaphores.get(loop)
+        if loop_semaphores is None:
+            _evict_closed_loops()
+            loop_semaphores = _loop_semaphores[loop] = weakref.WeakKeyDictionary()
+        semaphore = loop_semaphores.get(owner)
+        if semaphore is None:
+            semaphore = loop_semaphores[owner] = asyncio.Semaphore(limit)
+    return semaphore
+
+
+async def aclose_shared_clients(loop: asyncio.AbstractEventLoop = None) -> None:
+    """
+    关闭指定事件循环共享的全部异步客户端，释放其HTTP连接池和各组件在该事件循环上的信号量
+    
+    关闭后该事件循环中再次请求时会重新创建客户端。该事件循环中所有组件共用这些客户端，
+    关闭会使仍在进行的请求失败，因此只应由事件循环的所有者在不再发起请求、事件循环关闭前调用
+    
+    Args:
+        loop: 事件循环，默认为当前运行中的事件循环
+    """
+    loop = loop or asyncio.get_running_loop()
+    with _shared_clients_lock:
+        loop_clients = _shared_async_clients.pop(loop, {})
+        _loop_semaphores.pop(loop, None)
+    for async_client in loop_clients.values():
+        await async_client.close()
+
+
+# 已确认的API密钥探测结果，键为(api_key, base_url)，值为(是否有效, 探测时间)
+_api_key_status = {}
+
+
+async def check_api_key(async_client: AsyncOpenAI) -> bool:
+    """
+    通过一次轻量的模型列表请求确认API密钥有效
+    
+    只有请求成功或服务端明确拒绝认证才是确定的结果，在API_KEY_STATUS_TTL内复用；
+    接口不支持、超时等其他错误无法说明密钥无效，本次视为有效但不缓存，下次调用时重新探测
+    
+    Args:
+        async_client: 待校验的异步OpenAI客户端
+        
+    Returns:
+        API密钥是否可用
+    """
+    key = (async_client.api_key, str(async_client.base_url))
+    entry = _api_key_status.get(key)
+    if entry is not None and time.monotonic() - entry[1] <= API_KEY_STATUS_TTL:
+        return entry[0]
+    
+    try:
+        await async_client.with_options(max_retries=0, timeout=API_KEY_PROBE_TIMEOUT).models.list()
+        status = True
+    except AuthenticationError:
+        status = False
+    except Exception:
+        return True
+    _api_key_status[key] = (status, time.monotonic())
+    return status
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+# 默认缓存目录，可通过环境变量KDAS_LLM_CACHE_DIR调整
+DEFAULT_CACHE_DIR = '~/.cache/kdas/llm'
+
+# 默认缓存有效期（秒），可通过环境变量KDAS_LLM_CACHE_TTL调整，设为0时禁用缓存
+DEFAULT_CACHE_TTL = 6 * 3600
+
+# 内存中保留的最近回复数量，命中时无需读取磁盘文件
+DEFAULT_MEMORY_SIZE = 128
+
+
+class ResponseCache:
+    """LLM回复缓存 - 以确定性摘要为键，内存LRU在前、磁盘文件在后，按写入时间判断过期"""
+
+    def __init__(self, cache_dir: str = None, ttl: float = None, memory_size: int = DEFAULT_MEMORY_SIZE):
+        """
+        初始化回复缓存
+
+        Args:
+            cache_dir: 缓存目录
+            ttl: 缓存有效期（秒）
+            memory_size: 内存中保留的回复数量，为0时只使用磁盘缓存
+        """
+        self.cache_dir = os.path.expanduser(cache_dir or os.getenv('KDAS_LLM_CACHE_DIR', DEFAULT_CACHE_DIR))
+        self.ttl = float(ttl if ttl is not None else os.getenv('KDAS_LLM_CACHE_TTL', DEFAULT_CACHE_TTL))
+        self.memory_size = memory_size
+        # 键 -> (写入时间, 回复文本)，异步路径会在线程池中并发读写，需要加锁
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """
+        根据任意可JSON序列化的组成部分生成16字节的缓存键
+
+        Args:
+            parts: 参与计算缓存键的数据
+
+        Returns:
+            32位十六进制缓存键
+        """
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _remember(self, key: str, response: str, written_at: float) -> None:
+        """将回复放入内存LRU，超出容量时淘汰最久未使用的条目"""
+        if self.memory_size <= 0:
+            return
+        with self._memory_lock:
+            self._memory[key] = (written_at, response)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存的回复
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的回复文本，未命中、已过期或缓存内容为空时返回None
+        """
+        if self.ttl <= 0:
+            return None
+
+        now = time.time()
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    return entry[1]
+                del self._memory[key]
+
+        path = self._path(key)
+        try:
+            mtime = os.path.getmtime(path)
+            if now - mtime > self.ttl:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                response = json.load(f)['response']
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if not response:
+            return None
+
+        self._remember(key, response, mtime)
+        return response
+
+    def set(self, key: str, response: str) -> None:
+        """
+        写入回复缓存，空回复不缓存，写入失败时静默忽略
+
+        Args:
+            key: 缓存键
+            response: 回复文本
+        """
+        if self.ttl <= 0 or not response:
+            return
+
+        self._remember(key, response, time.time())
+
+        # 异步路径在线程池中写入，同一进程的多个线程可能同时写入同一个键，临时文件名需对每次写入唯一
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with open(fd, 'w', encoding='utf-8') as f:
+                json.dump({'response': response}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
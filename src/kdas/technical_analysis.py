@@ -1,27 +1,250 @@
+import os
+import copy
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+from dataclasses import dataclass
 from typing import List, Dict
-from .utils import safe_json_convert
+from ._njit import njit, NUMBA_AVAILABLE
+
+
+@njit(cache=True)
+def _local_extrema_njit(arr: np.ndarray, window: int, is_high: bool) -> np.ndarray:
+    """
+    局部极值点的JIT内核，逐点与前后window个点比较，遇到不满足的点立即跳出
+    
+    Args:
+        arr: 价格数组
+        window: 比较窗口半径
+        is_high: True寻找局部最高点，False寻找局部最低点
+        
+    Returns:
+        局部极值点的位置数组
+    """
+    n = len(arr)
+    out = np.empty(max(n - 2 * window, 0), dtype=np.int64)
+    count = 0
+    for i in range(window, n - window):
+        center = arr[i]
+        is_extreme = True
+        for j in range(i - window, i + window + 1):
+            if j == i:
+                continue
+            if is_high:
+                if not center >= arr[j]:
+                    is_extreme = False
+                    break
+            else:
+                if not center <= arr[j]:
+                    is_extreme = False
+                    break
+        if is_extreme:
+            out[count] = i
+            count += 1
+    return out[:count]
+
+
+@njit(cache=True)
+def _tail_mean_njit(values: np.ndarray, window: int, offset: int) -> float:
+    """计算截止到倒数第offset个值之前的window日均值，数据不足时返回NaN"""
+    end = len(values) - offset
+    if end < window:
+        return np.nan
+    return values[end - window:end].mean()
+
+
+@njit(cache=True)
+def _ma_stats(close: np.ndarray):
+    """
+    一次性计算5/20/60日均线的最新值及N-1个交易日前的值
+    
+    Args:
+        close: 收盘价数组
+        
+    Returns:
+        (ma5, ma5_prev, ma20, ma20_prev, ma60, ma60_prev) 元组，数据不足时对应值为NaN
+    """
+    return (
+        _tail_mean_njit(close, 5, 0), _tail_mean_njit(close, 5, 4),
+        _tail_mean_njit(close, 20, 0), _tail_mean_njit(close, 20, 19),
+        _tail_mean_njit(close, 60, 0), _tail_mean_njit(close, 60, 59)
+    )
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    基于累加和的滚动均值，与rolling(window, min_periods=1).mean()一致
+    
+    NaN不计入累加和与有效数据个数，只影响包含它的窗口，不会传递到之后的所有窗口；
+    窗口内没有有效数据时结果为NaN
+    """
+    valid = ~np.isnan(values)
+    cumsum = np.cumsum(np.where(valid, values, 0.0))
+    total = cumsum.copy()
+    total[window:] -= cumsum[:-window]
+    cumcount = np.cumsum(valid)
+    counts = cumcount.copy()
+    counts[window:] -= cumcount[:-window]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return total / counts
+
+
+@dataclass
+class PreparedFrame:
+    """技术分析使用的列式数据，在分析入口处从排序后的DataFrame一次性构建"""
+    dates: np.ndarray
+    date_str: np.ndarray
+    close: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    volume: np.ndarray
+    volume_ma20: np.ndarray
+    
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'PreparedFrame':
+        """
+        从按日期排序的DataFrame构建列式数据
+        
+        Args:
+            df: 包含价格和成交量数据的DataFrame
+            
+        Returns:
+            PreparedFrame实例
+        """
+        volume = df['成交量'].to_numpy(dtype=np.float64)
+        dates = df['日期'].to_numpy(dtype='datetime64[ns]')
+        return cls(
+            dates=dates,
+            # 日期字符串一次性批量格式化，后续按下标取用
+            date_str=np.datetime_as_string(dates, unit='D'),
+            close=df['收盘'].to_numpy(dtype=np.float64),
+            high=df['最高'].to_numpy(dtype=np.float64),
+            low=df['最低'].to_numpy(dtype=np.float64),
+            volume=volume,
+            volume_ma20=_rolling_mean(volume, 20)
+        )
+
+
+def _analyze_worker(df: pd.DataFrame) -> Dict:
+    """子进程中执行单只证券的技术分析"""
+    return TechnicalAnalyzer().analyze_technical_indicators(df)
+
+
+# 技术分析结果缓存中参与计算数据指纹的列
+FINGERPRINT_COLUMNS = ['日期', '收盘', '最高', '最低', '成交量']
 
 
 class TechnicalAnalyzer:
     """技术分析器类 - 负责计算各种技术指标"""
     
+    def __init__(self, cache_size: int = 8):
+        """
+        初始化技术分析器
+        
+        Args:
+            cache_size: 按数据指纹缓存的技术分析结果数量，为0时不缓存
+        """
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # 异步路径会在线程池中调用分析，缓存读写需要加锁
+        self._cache_lock = threading.Lock()
+        # 正在计算中的数据指纹，相同数据的并发调用等待首个调用的结果而不重复计算
+        self._pending = {}
+    
+    def analyze_many(self, dfs: Dict[str, pd.DataFrame], max_workers: int = None) -> Dict[str, Dict]:
+        """
+        使用多进程并行分析多只证券的技术指标
+        
+        Args:
+            dfs: 证券代码到价格数据DataFrame的字典
+            max_workers: 进程数量，默认为CPU核心数
+            
+        Returns:
+            证券代码到技术分析结果的字典
+        """
+        # 按数据指纹去重，内容相同的多只证券只分析一次
+        unique_dfs = {}
+        symbol_keys = {}
+        for symbol, df in dfs.items():
+            key = self._fingerprint(df)
+            unique_dfs.setdefault(key, df)
+            symbol_keys[symbol] = key
+        
+        if len(unique_dfs) <= 1:
+            results = {key: self.analyze_technical_indicators(df) for key, df in unique_dfs.items()}
+        else:
+            max_workers = min(max_workers or os.cpu_count() or 1, len(unique_dfs))
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = dict(zip(unique_dfs.keys(), executor.map(_analyze_worker, unique_dfs.values())))
+        
+        # 数据相同的证券各自得到独立的结果字典
+        return {symbol: copy.deepcopy(results[key]) for symbol, key in symbol_keys.items()}
+    
     def analyze_technical_indicators(self, df: pd.DataFrame) -> Dict:
         """
-        分析技术指标和关键价格点
+        分析技术指标和关键价格点，相同数据的分析结果从LRU缓存中直接返回
         
         Args:
             df: 包含价格和成交量数据的DataFrame
             
         Returns:
-            包含技术分析结果的字典
+            包含技术分析结果的字典；缓存中保存的是独立副本，调用方修改返回值不影响缓存和其他调用方
         """
         if df.empty:
             return {}
+        
+        if self.cache_size <= 0:
+            return self._compute_technical_indicators(df)
+        
+        key = self._fingerprint(df)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return copy.deepcopy(cached)
+            pending = self._pending.get(key)
+            is_owner = pending is None
+            if is_owner:
+                pending = self._pending[key] = threading.Event()
+        
+        if not is_owner:
+            # 相同数据正在其他线程中计算，等待其完成后从缓存读取；计算失败或已被淘汰时自行计算
+            pending.wait()
+            with self._cache_lock:
+                cached = self._cache.get(key)
+            return copy.deepcopy(cached) if cached is not None else self._compute_technical_indicators(df)
+        
+        try:
+            analysis = self._compute_technical_indicators(df)
             
-        # 确保数据按日期排序
-        df = df.sort_values('日期').reset_index(drop=True)
+            with self._cache_lock:
+                self._cache[key] = copy.deepcopy(analysis)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        finally:
+            with self._cache_lock:
+                del self._pending[key]
+            pending.set()
+        
+        return analysis
+    
+    @staticmethod
+    def _fingerprint(df: pd.DataFrame) -> tuple:
+        """计算数据指纹：行数加各行哈希值之和，与行顺序无关（分析前会按日期排序）"""
+        row_hashes = pd.util.hash_pandas_object(df[FINGERPRINT_COLUMNS], index=False)
+        return len(df), int(row_hashes.sum())
+    
+    def _compute_technical_indicators(self, df: pd.DataFrame) -> Dict:
+        """计算技术指标和关键价格点"""
+        # 确保数据按日期排序，上游数据通常已经有序，只在必要时排序
+        if not df['日期'].is_monotonic_increasing:
+            df = df.sort_values('日期').reset_index(drop=True)
+        
+        frame = PreparedFrame.from_frame(df)
         
         # 计算技术指标
         analysis = {}
@@ -32,7 +255,7 @@ class TechnicalAnalyzer:
             'max_price': float(df['最高'].max()),
             'min_price': float(df['最低'].min()),
             'avg_price': float(df['收盘'].mean()),
-            'price_volatility': float(df['收盘'].std())
+            'price_volatility': float(df['收盘'].std()) if len(df) > 1 else None
         }
         
         # 2. 成交量分析
@@ -47,150 +270,140 @@ class TechnicalAnalyzer:
         }
         
         # 3. 识别重要的价格转折点
-        analysis['key_levels'] = self._find_key_price_levels(df)
+        analysis['key_levels'] = self._find_key_price_levels(frame)
         
         # 4. 识别异常成交量日期
-        analysis['volume_spikes'] = self._find_volume_spikes(df)
+        analysis['volume_spikes'] = self._find_volume_spikes(frame)
         
         # 5. 趋势分析
-        analysis['trend_analysis'] = self._analyze_trends(df)
+        analysis['trend_analysis'] = self._analyze_trends(frame)
         
         # 6. 支撑阻力位分析
-        analysis['support_resistance'] = self._find_support_resistance(df)
+        analysis['support_resistance'] = self._find_support_resistance(frame)
         
-        # 确保所有数据都是JSON可序列化的
-        return safe_json_convert(analysis)
+        # 各部分在生成时已转换为Python原生类型，可直接JSON序列化
+        return analysis
     
-    def _find_key_price_levels(self, df: pd.DataFrame) -> List[Dict]:
+    def _find_key_price_levels(self, frame: PreparedFrame) -> List[Dict]:
         """寻找关键价格水平（高点、低点）"""
         key_levels = []
         
         # 寻找局部高点和低点
-        high_points = self._find_local_extrema(df['最高'], is_high=True)
-        low_points = self._find_local_extrema(df['最低'], is_high=False)
+        high_points = self._find_local_extrema(frame.high, is_high=True)
+        low_points = self._find_local_extrema(frame.low, is_high=False)
         
         # 添加显著的高点
         for idx in high_points[-10:]:  # 最近10个高点
-            if idx < len(df):
-                key_levels.append({
-                    'date': df.iloc[idx]['日期'].strftime('%Y-%m-%d'),
-                    'price': float(df.iloc[idx]['最高']),
-                    'type': 'high',
-                    'volume': float(df.iloc[idx]['成交量'])
-                })
+            key_levels.append({
+                'date': str(frame.date_str[idx]),
+                'price': float(frame.high[idx]),
+                'type': 'high',
+                'volume': float(frame.volume[idx])
+            })
         
         # 添加显著的低点
         for idx in low_points[-10:]:  # 最近10个低点
-            if idx < len(df):
-                key_levels.append({
-                    'date': df.iloc[idx]['日期'].strftime('%Y-%m-%d'),
-                    'price': float(df.iloc[idx]['最低']),
-                    'type': 'low',
-                    'volume': float(df.iloc[idx]['成交量'])
-                })
+            key_levels.append({
+                'date': str(frame.date_str[idx]),
+                'price': float(frame.low[idx]),
+                'type': 'low',
+                'volume': float(frame.volume[idx])
+            })
         
         # 按日期排序
         key_levels.sort(key=lambda x: x['date'])
         
-        return safe_json_convert(key_levels)
+        return key_levels
     
-    def _find_local_extrema(self, series: pd.Series, is_high: bool = True, window: int = 5) -> List[int]:
+    def _find_local_extrema(self, values: np.ndarray, is_high: bool = True, window: int = 5) -> List[int]:
         """寻找局部极值点"""
-        extrema = []
+        arr = np.asarray(values, dtype=np.float64)
+        if len(arr) < 2 * window + 1:
+            return []
         
-        for i in range(window, len(series) - window):
-            if is_high:
-                # 寻找局部最高点
-                if all(series.iloc[i] >= series.iloc[j] for j in range(i-window, i+window+1) if j != i):
-                    extrema.append(i)
-            else:
-                # 寻找局部最低点
-                if all(series.iloc[i] <= series.iloc[j] for j in range(i-window, i+window+1) if j != i):
-                    extrema.append(i)
+        if NUMBA_AVAILABLE:
+            return _local_extrema_njit(arr, window, is_high).tolist()
         
-        return extrema
+        # 每个候选点与其前后window个点组成的窗口，中心点等于窗口最值即为局部极值
+        windows = sliding_window_view(arr, 2 * window + 1)
+        center = arr[window:len(arr) - window]
+        if is_high:
+            mask = center == windows.max(axis=1)
+        else:
+            mask = center == windows.min(axis=1)
+        
+        return (np.flatnonzero(mask) + window).tolist()
     
-    def _find_volume_spikes(self, df: pd.DataFrame, threshold_multiplier: float = 2.0) -> List[Dict]:
+    def _find_volume_spikes(self, frame: PreparedFrame, threshold_multiplier: float = 2.0) -> List[Dict]:
         """寻找成交量异常放大的日期"""
-        avg_volume = df['成交量'].rolling(window=20, min_periods=1).mean()
-        volume_spikes = []
-        
-        for i, row in df.iterrows():
-            if row['成交量'] > avg_volume.iloc[i] * threshold_multiplier:
-                volume_spikes.append({
-                    'date': row['日期'].strftime('%Y-%m-%d'),
-                    'volume': float(row['成交量']),
-                    'avg_volume': float(avg_volume.iloc[i]),
-                    'multiplier': float(row['成交量'] / avg_volume.iloc[i]),
-                    'price': float(row['收盘'])
-                })
-        
-        # 只返回最显著的成交量异常
-        volume_spikes.sort(key=lambda x: x['multiplier'], reverse=True)
-        return safe_json_convert(volume_spikes[:15])  # 最多返回15个
+        volume = frame.volume
+        avg_volume = frame.volume_ma20
+        
+        idx = np.flatnonzero(volume > avg_volume * threshold_multiplier)
+        multiplier = volume[idx] / avg_volume[idx]
+        
+        # 只返回最显著的成交量异常，最多返回15个（稳定排序，倍数相同时保持日期顺序）
+        top = np.argsort(-multiplier, kind='stable')[:15]
+        idx = idx[top]
+        multiplier = multiplier[top]
+        
+        # 先按列取出结果数组，再一次性转换为Python原生类型组装字典
+        columns = zip(
+            frame.date_str[idx].tolist(),
+            volume[idx].tolist(),
+            avg_volume[idx].tolist(),
+            multiplier.tolist(),
+            frame.close[idx].tolist()
+        )
+        return [
+            {'date': date, 'volume': vol, 'avg_volume': avg, 'multiplier': mult, 'price': price}
+            for date, vol, avg, mult, price in columns
+        ]
     
-    def _analyze_trends(self, df: pd.DataFrame) -> Dict:
+    def _analyze_trends(self, frame: PreparedFrame) -> Dict:
         """分析价格趋势"""
-        # 计算不同周期的移动平均线
-        df_temp = df.copy()
-        df_temp['MA5'] = df_temp['收盘'].rolling(window=5).mean()
-        df_temp['MA10'] = df_temp['收盘'].rolling(window=10).mean()
-        df_temp['MA20'] = df_temp['收盘'].rolling(window=20).mean()
-        df_temp['MA60'] = df_temp['收盘'].rolling(window=60).mean()
+        # 只需要各均线的最新值和N日前的值，由JIT内核一次性对收盘价尾部求均值，无需计算完整滚动序列
+        close = frame.close
+        current_price = close[-1]
         
-        current_price = df_temp['收盘'].iloc[-1]
-        
-        # 确保布尔值转换为Python原生bool类型
-        ma5_valid = not pd.isna(df_temp['MA5'].iloc[-1]) if len(df_temp) > 0 else False
-        ma20_valid = not pd.isna(df_temp['MA20'].iloc[-1]) if len(df_temp) > 0 else False  
-        ma60_valid = not pd.isna(df_temp['MA60'].iloc[-1]) if len(df_temp) > 0 else False
+        ma5, ma5_prev, ma20, ma20_prev, ma60, ma60_prev = _ma_stats(close)
         
         trend_analysis = {
             'short_term': 'neutral',  # 5日均线趋势
             'medium_term': 'neutral',  # 20日均线趋势  
             'long_term': 'neutral',   # 60日均线趋势
             'ma_positions': {
-                'above_ma5': bool(current_price > df_temp['MA5'].iloc[-1]) if ma5_valid else False,
-                'above_ma20': bool(current_price > df_temp['MA20'].iloc[-1]) if ma20_valid else False,
-                'above_ma60': bool(current_price > df_temp['MA60'].iloc[-1]) if ma60_valid else False
+                'above_ma5': bool(current_price > ma5),
+                'above_ma20': bool(current_price > ma20),
+                'above_ma60': bool(current_price > ma60)
             }
         }
         
-        # 判断趋势方向
-        if len(df_temp) >= 5:
-            ma5_trend = df_temp['MA5'].iloc[-1] - df_temp['MA5'].iloc[-5] if not pd.isna(df_temp['MA5'].iloc[-1]) else 0
-            trend_analysis['short_term'] = 'bullish' if ma5_trend > 0 else 'bearish'
-        
-        if len(df_temp) >= 20:
-            ma20_trend = df_temp['MA20'].iloc[-1] - df_temp['MA20'].iloc[-20] if not pd.isna(df_temp['MA20'].iloc[-1]) else 0
-            trend_analysis['medium_term'] = 'bullish' if ma20_trend > 0 else 'bearish'
+        # 判断趋势方向：比较当前均线与N-1个交易日前的均线，任一值缺失时视为看跌
+        for key, window, ma_now, ma_prev in (('short_term', 5, ma5, ma5_prev),
+                                             ('medium_term', 20, ma20, ma20_prev),
+                                             ('long_term', 60, ma60, ma60_prev)):
+            if len(close) >= window:
+                trend_analysis[key] = 'bullish' if ma_now - ma_prev > 0 else 'bearish'
         
-        if len(df_temp) >= 60:
-            ma60_trend = df_temp['MA60'].iloc[-1] - df_temp['MA60'].iloc[-60] if not pd.isna(df_temp['MA60'].iloc[-1]) else 0
-            trend_analysis['long_term'] = 'bullish' if ma60_trend > 0 else 'bearish'
-        
-        return safe_json_convert(trend_analysis)
+        return trend_analysis
     
-    def _find_support_resistance(self, df: pd.DataFrame) -> Dict:
+    def _find_support_resistance(self, frame: PreparedFrame, num_levels: int = 5) -> Dict:
         """寻找支撑位和阻力位"""
-        # 简化的支撑阻力位识别
-        recent_data = df.tail(60)  # 最近60个交易日
-        
-        # 计算价格分布
-        price_levels = []
-        for _, row in recent_data.iterrows():
-            price_levels.extend([row['最高'], row['最低'], row['收盘']])
-        
-        # 使用价格聚类来识别支撑阻力位
-        price_levels = sorted(price_levels)
-        current_price = df['收盘'].iloc[-1]
+        # 简化的支撑阻力位识别：最近60个交易日的最高、最低、收盘价构成价格分布
+        price_levels = np.concatenate([frame.high[-60:], frame.low[-60:], frame.close[-60:]])
+        current_price = float(frame.close[-1])
         
-        support_levels = [p for p in price_levels if p < current_price][-5:]  # 最近5个支撑位
-        resistance_levels = [p for p in price_levels if p > current_price][:5]  # 最近5个阻力位
+        # 只需离当前价最近的几个价位，用partition取出后再对这几个值排序，避免全量排序
+        below = price_levels[price_levels < current_price]
+        above = price_levels[price_levels > current_price]
+        if below.size > num_levels:
+            below = np.partition(below, -num_levels)[-num_levels:]
+        if above.size > num_levels:
+            above = np.partition(above, num_levels - 1)[:num_levels]
         
-        result = {
-            'support_levels': [float(level) for level in support_levels],
-            'resistance_levels': [float(level) for level in resistance_levels],
-            'current_price': float(current_price)
+        return {
+            'support_levels': np.sort(below).tolist(),  # 最近5个支撑位
+            'resistance_levels': np.sort(above).tolist(),  # 最近5个阻力位
+            'current_price': current_price
         }
-        return safe_json_convert(result) 
\ No newline at end of file
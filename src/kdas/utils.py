@@ -1,7 +1,39 @@
+import json
 import pandas as pd
 import numpy as np
 from typing import Any
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _convert_float(obj: float) -> Any:
+    # NaN不等于自身，转换为None
+    return None if obj != obj else obj
+
+
+def _convert_numpy_float(obj: np.floating) -> Any:
+    # NumPy浮点数的NaN同样转换为None，否则json模块会输出无效的NaN
+    return None if obj != obj else float(obj)
+
+
+# 按具体类型直接分派的转换函数，避免对常见类型逐个进行isinstance判断
+_CONVERTERS = {
+    str: lambda obj: obj,
+    int: lambda obj: obj,
+    bool: lambda obj: obj,
+    type(None): lambda obj: obj,
+    float: _convert_float,
+    np.float64: _convert_numpy_float,
+    np.float32: _convert_numpy_float,
+    np.int64: int,
+    np.int32: int,
+    np.bool_: bool,
+    np.ndarray: lambda obj: safe_json_convert(obj.tolist()),
+}
+
 
 def safe_json_convert(obj: Any) -> Any:
     """
@@ -13,19 +45,52 @@ def safe_json_convert(obj: Any) -> Any:
     Returns:
         可以JSON序列化的对象
     """
+    obj_type = type(obj)
+    if obj_type is dict:
+        return {k: safe_json_convert(v) for k, v in obj.items()}
+    if obj_type is list:
+        return [safe_json_convert(item) for item in obj]
+    
+    converter = _CONVERTERS.get(obj_type)
+    if converter is not None:
+        return converter(obj)
+    
+    # 其他类型（子类、其余NumPy标量等）走通用判断
     if isinstance(obj, dict):
         return {k: safe_json_convert(v) for k, v in obj.items()}
     elif isinstance(obj, list):
         return [safe_json_convert(item) for item in obj]
-    elif isinstance(obj, (np.integer, np.int64, np.int32)):
+    elif isinstance(obj, np.integer):
         return int(obj)
-    elif isinstance(obj, (np.floating, np.float64, np.float32)):
-        return float(obj)
+    elif isinstance(obj, np.floating):
+        return _convert_numpy_float(obj)
     elif isinstance(obj, (np.bool_, bool)):
         return bool(obj)
     elif isinstance(obj, np.ndarray):
-        return obj.tolist()
+        return safe_json_convert(obj.tolist())
     elif pd.isna(obj):
         return None
     else:
-        return obj 
\ No newline at end of file
+        return obj
+
+
+def dumps_json(obj: Any, indent: bool = True) -> str:
+    """
+    将包含NumPy标量的数据序列化为JSON文本，安装了orjson时使用orjson
+    
+    Args:
+        obj: 需要序列化的对象
+        indent: 是否以两个空格缩进
+        
+    Returns:
+        JSON文本，中文字符不转义，NaN输出为null
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=safe_json_convert, option=option).decode('utf-8')
+    
+    if indent:
+        return json.dumps(safe_json_convert(obj), ensure_ascii=False, indent=2, default=str)
+    return json.dumps(safe_json_convert(obj), ensure_ascii=False, separators=(',', ':'), default=str)
@@ -6,9 +6,20 @@ KDAS AI顾问异步功能使用示例
 """
 
 import asyncio
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from kdas_ai_advisor import get_ai_advisor
+from kdas_ai_advisor import get_ai_advisor, TechnicalAnalyzer
+
+# 模拟数据的列类型：价格用float32即可满足演示精度，成交量和成交额为整数
+SAMPLE_DTYPES = {
+    '开盘': np.float32,
+    '收盘': np.float32,
+    '最高': np.float32,
+    '最低': np.float32,
+    '成交量': np.int64,
+    '成交额': np.int64
+}
 
 async def example_single_security_async():
     """单个证券的异步分析示例"""
@@ -19,16 +30,17 @@ async def example_single_security_async():
     advisor = get_ai_advisor(api_key="your-api-key-here", model="deepseek-r1")
     
     # 模拟证券数据（实际使用中应该从KDAS.py的get_security_data获取）
-    dates = pd.date_range(start='2024-01-01', end='2024-12-31', freq='D')
+    dates = pd.DatetimeIndex(np.arange('2024-01-01', '2025-01-01', dtype='datetime64[D]'))
+    idx = np.arange(len(dates), dtype=np.float64)
     sample_data = pd.DataFrame({
         '日期': dates,
-        '开盘': [100 + i*0.1 for i in range(len(dates))],
-        '收盘': [100.5 + i*0.1 for i in range(len(dates))],
-        '最高': [101 + i*0.1 for i in range(len(dates))],
-        '最低': [99.5 + i*0.1 for i in range(len(dates))],
-        '成交量': [1000000 + i*1000 for i in range(len(dates))],
-        '成交额': [100000000 + i*100000 for i in range(len(dates))]
-    })
+        '开盘': 100 + 0.1 * idx,
+        '收盘': 100.5 + 0.1 * idx,
+        '最高': 101 + 0.1 * idx,
+        '最低': 99.5 + 0.1 * idx,
+        '成交量': 1000000 + 1000 * idx,
+        '成交额': 100000000 + 100000 * idx
+    }).astype(SAMPLE_DTYPES)
     
     # 示例日期配置
     input_dates = {
@@ -68,58 +80,67 @@ async def example_single_security_async():
     except Exception as e:
         print(f"❌ 分析失败: {str(e)}")
 
-async def example_batch_analysis_async():
-    """批量证券异步分析示例"""
+async def example_batch_analysis_async(max_concurrency: int = 5):
+    """
+    批量证券异步分析示例
+    
+    Args:
+        max_concurrency: 同时进行AI分析的最大证券数量，避免并发过高触发API限流
+    """
     print("\n🚀 批量证券异步分析示例")
     print("=" * 50)
     
     # 初始化AI顾问
     advisor = get_ai_advisor(api_key="your-api-key-here", model="deepseek-r1")
     
-    # 模拟多个证券的数据
-    securities_data = []
-    
+    # 模拟多个证券的数据，示例数据只构建一次，各证券共享同一只读DataFrame
     securities_info = [
         ("000001", "平安银行", "股票"),
         ("159915", "创业板ETF", "ETF"),
         ("000300", "沪深300", "指数")
     ]
     
-    for symbol, name, sec_type in securities_info:
-        # 为每个证券创建模拟数据
-        dates = pd.date_range(start='2024-01-01', end='2024-12-31', freq='D')
-        sample_data = pd.DataFrame({
-            '日期': dates,
-            '开盘': [100 + i*0.1 for i in range(len(dates))],
-            '收盘': [100.5 + i*0.1 for i in range(len(dates))],
-            '最高': [101 + i*0.1 for i in range(len(dates))],
-            '最低': [99.5 + i*0.1 for i in range(len(dates))],
-            '成交量': [1000000 + i*1000 for i in range(len(dates))],
-            '成交额': [100000000 + i*100000 for i in range(len(dates))]
-        })
-        
-        input_dates = {
-            'day1': '20240924',
-            'day2': '20241107', 
-            'day3': '20241217',
-            'day4': '20250407',
-            'day5': '20250423'
-        }
-        
-        securities_data.append({
+    dates = pd.DatetimeIndex(np.arange('2024-01-01', '2025-01-01', dtype='datetime64[D]'))
+    idx = np.arange(len(dates), dtype=np.float64)
+    sample_data = pd.DataFrame({
+        '日期': dates,
+        '开盘': 100 + 0.1 * idx,
+        '收盘': 100.5 + 0.1 * idx,
+        '最高': 101 + 0.1 * idx,
+        '最低': 99.5 + 0.1 * idx,
+        '成交量': 1000000 + 1000 * idx,
+        '成交额': 100000000 + 100000 * idx
+    }).astype(SAMPLE_DTYPES)
+    
+    input_dates = {
+        'day1': '20240924',
+        'day2': '20241107', 
+        'day3': '20241217',
+        'day4': '20250407',
+        'day5': '20250423'
+    }
+    
+    securities_data = [
+        {
             'df': sample_data,
             'symbol': symbol,
             'security_name': name,
             'security_type': sec_type,
             'input_dates': input_dates
-        })
+        }
+        for symbol, name, sec_type in securities_info
+    ]
     
     try:
         print(f"⏰ 开始批量分析 {len(securities_data)} 个证券...")
         start_time = datetime.now()
         
-        # 使用batch_analyze_securities_async方法批量分析
-        results = await advisor.batch_analyze_securities_async(securities_data)
+        # 使用batch_analyze_securities_async方法批量分析，max_concurrency限制同时进行的AI分析数量
+        results = await advisor.batch_analyze_securities_async(
+            securities_data,
+            api_key="your-api-key-here",
+            max_concurrency=max_concurrency
+        )
         
         end_time = datetime.now()
         elapsed = (end_time - start_time).total_seconds()
@@ -136,24 +157,37 @@ async def example_batch_analysis_async():
     except Exception as e:
         print(f"❌ 批量分析失败: {str(e)}")
 
+def get_uncached_advisor():
+    """
+    创建关闭了全部缓存的AI顾问，用于性能对比
+    
+    LLM回复缓存（内存和磁盘）和技术分析缓存会让后续测试直接读取前一次测试的结果，
+    每种方式都使用新的无缓存实例，才能比较真实的请求耗时
+    """
+    advisor = get_ai_advisor(api_key="your-api-key-here", model="deepseek-r1")
+    for component in (advisor.ai_engine, advisor.kdas_analyzer):
+        component.response_cache.ttl = 0
+        component.response_cache.memory_size = 0
+    advisor.technical_analyzer = advisor.ai_engine.technical_analyzer = TechnicalAnalyzer(cache_size=0)
+    return advisor
+
 async def example_performance_comparison():
     """性能对比示例：同步 vs 异步"""
     print("\n🚀 性能对比示例：同步 vs 异步")
     print("=" * 50)
     
-    advisor = get_ai_advisor(api_key="your-api-key-here", model="deepseek-r1")
-    
     # 准备测试数据
-    dates = pd.date_range(start='2024-01-01', end='2024-12-31', freq='D')
+    dates = pd.DatetimeIndex(np.arange('2024-01-01', '2025-01-01', dtype='datetime64[D]'))
+    idx = np.arange(len(dates), dtype=np.float64)
     sample_data = pd.DataFrame({
         '日期': dates,
-        '开盘': [100 + i*0.1 for i in range(len(dates))],
-        '收盘': [100.5 + i*0.1 for i in range(len(dates))],
-        '最高': [101 + i*0.1 for i in range(len(dates))],
-        '最低': [99.5 + i*0.1 for i in range(len(dates))],
-        '成交量': [1000000 + i*1000 for i in range(len(dates))],
-        '成交额': [100000000 + i*100000 for i in range(len(dates))]
-    })
+        '开盘': 100 + 0.1 * idx,
+        '收盘': 100.5 + 0.1 * idx,
+        '最高': 101 + 0.1 * idx,
+        '最低': 99.5 + 0.1 * idx,
+        '成交量': 1000000 + 1000 * idx,
+        '成交额': 100000000 + 100000 * idx
+    }).astype(SAMPLE_DTYPES)
     
     input_dates = {
         'day1': '20240924',
@@ -166,12 +200,13 @@ async def example_performance_comparison():
     try:
         # 同步方式：顺序执行
         print("⏰ 同步方式测试...")
+        advisor = get_uncached_advisor()
         sync_start = datetime.now()
         
-        recommendation_result = advisor.generate_kdas_recommendation(
+        recommendation_result = advisor.ai_engine.generate_kdas_recommendation(
             sample_data, "000001", "平安银行", "股票"
         )
-        analysis_result = advisor.analyze_kdas_state(
+        analysis_result = advisor.kdas_analyzer.analyze_kdas_state(
             sample_data, input_dates, "000001", "平安银行", "股票"
         )
         
@@ -180,12 +215,38 @@ async def example_performance_comparison():
         
         print(f"📊 同步方式耗时: {sync_elapsed:.2f}秒")
         
-        # 异步方式：并发执行
+        # 线程池方式：两个相互独立的同步调用放入线程池并发执行
+        print("⏰ 线程池方式测试...")
+        advisor = get_uncached_advisor()
+        thread_start = datetime.now()
+        
+        loop = asyncio.get_running_loop()
+        recommendation_result, analysis_result = await asyncio.gather(
+            loop.run_in_executor(
+                None, advisor.ai_engine.generate_kdas_recommendation,
+                sample_data, "000001", "平安银行", "股票"
+            ),
+            loop.run_in_executor(
+                None, advisor.kdas_analyzer.analyze_kdas_state,
+                sample_data, input_dates, "000001", "平安银行", "股票"
+            )
+        )
+        
+        thread_elapsed = (datetime.now() - thread_start).total_seconds()
+        print(f"🧵 线程池方式耗时: {thread_elapsed:.2f}秒")
+        
+        # 异步方式：日期推荐和状态分析互不依赖，使用asyncio.gather并发执行
         print("⏰ 异步方式测试...")
+        advisor = get_uncached_advisor()
         async_start = datetime.now()
         
-        async_result = await advisor.analyze_all_async(
-            sample_data, "000001", "平安银行", "股票", input_dates
+        recommendation_result, analysis_result = await asyncio.gather(
+            advisor.ai_engine.generate_kdas_recommendation_async(
+                sample_data, "000001", "平安银行", "股票"
+            ),
+            advisor.kdas_analyzer.analyze_kdas_state_async(
+                sample_data, input_dates, "000001", "平安银行", "股票"
+            )
         )
         
         async_end = datetime.now() 
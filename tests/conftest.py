@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+测试共用的fixture
+
+make_frame: 生成指定长度和随机种子的日线行情数据，列名与akshare返回的数据一致
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def make_frame():
+    """返回行情数据的构造函数：make_frame(n=120, seed=0)"""
+    def build(n: int = 120, seed: int = 0) -> pd.DataFrame:
+        rng = np.random.default_rng(seed)
+        close = np.round(rng.random(n) * 20 + 5, 2)
+        return pd.DataFrame({
+            # pandas 3默认使用微秒精度，与数据缓存读出的纳秒精度保持一致
+            '日期': pd.bdate_range('2024-01-02', periods=n).astype('datetime64[ns]'),
+            '开盘': close,
+            '收盘': close,
+            '最高': close + 0.5,
+            '最低': close - 0.5,
+            '成交额': rng.random(n) * 1e9,
+            '成交量': rng.random(n) * 1e7 + 1,
+        })
+
+    return build
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+get_ai_advisor测试：不同调用方的API密钥和模型互不影响
+
+使用方法：
+python -m pytest tests/test_advisor.py
+"""
+
+import os
+import sys
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from kdas.advisor import get_ai_advisor
+
+
+def test_advisors_do_not_share_credentials():
+    first = get_ai_advisor('sk-a', 'model-a')
+    # 分析方法以调用方传入的密钥和模型重新配置实例
+    first._configure_ai('sk-b', 'model-b')
+    
+    second = get_ai_advisor('sk-a', 'model-a')
+    
+    assert second is not first
+    assert (second.api_key, second.model) == ('sk-a', 'model-a')
+    assert (second.ai_engine.api_key, second.ai_engine.model) == ('sk-a', 'model-a')
+    assert (second.kdas_analyzer.api_key, second.kdas_analyzer.model) == ('sk-a', 'model-a')
+    # HTTP客户端仍在进程内按密钥共享
+    assert second.ai_engine.client is get_ai_advisor('sk-a', 'model-a').kdas_analyzer.client
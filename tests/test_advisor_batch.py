@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+KDASAIAdvisor.batch_analyze_securities_async测试：流水线的结果顺序、回调、进度与错误处理，以及API密钥无效时的提前返回
+
+数据获取和AI分析均以假实现替代，不访问网络
+
+使用方法：
+python -m pytest tests/test_advisor_batch.py
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import kdas.advisor as advisor_module
+from kdas.advisor import KDASAIAdvisor
+
+
+# 各证券数据获取的模拟耗时（秒），使完成顺序与输入顺序不同
+FETCH_DELAYS = {'000001': 0.05, '000002': 0.0, '000003': 0.02, '000004': 0.01}
+
+
+@pytest.fixture
+def advisor(monkeypatch):
+    async def check_api_key(async_client):
+        return True
+    
+    monkeypatch.setattr(advisor_module, 'check_api_key', check_api_key)
+    advisor = KDASAIAdvisor(api_key='sk-test', model='test-model')
+    
+    async def load_security(symbol, security_type):
+        await asyncio.sleep(FETCH_DELAYS.get(symbol, 0))
+        if symbol == '000004':
+            raise RuntimeError('数据获取失败')
+        return f'证券{symbol}', symbol
+    
+    async def analyze_security(df, security_type, symbol, security_name):
+        return {'success': True, 'symbol': symbol, 'security_name': security_name}
+    
+    advisor._load_security_async = load_security
+    advisor._analyze_security_data = analyze_security
+    return advisor
+
+
+def securities(*symbols):
+    return [{'security_type': '股票', 'symbol': symbol} for symbol in symbols]
+
+
+def test_results_follow_input_order(advisor):
+    completed = []
+    
+    results = asyncio.run(advisor.batch_analyze_securities_async(
+        securities('000001', '000002', '000003'), 'sk-test', 'test-model',
+        on_result=lambda result: completed.append(result['symbol'])
+    ))
+    
+    assert [result['symbol'] for result in results] == ['000001', '000002', '000003']
+    assert all(result['success'] for result in results)
+    # 回调按完成顺序调用
+    assert completed == ['000002', '000003', '000001']
+
+
+def test_failures_are_reported_per_security(advisor):
+    results = asyncio.run(advisor.batch_analyze_securities_async(
+        securities('000001', 'abc', '000004'), 'sk-test', 'test-model'
+    ))
+    
+    assert [result['success'] for result in results] == [True, False, False]
+    assert '证券代码格式错误' in results[1]['error']
+    assert '数据获取失败' in results[2]['error']
+
+
+def test_progress_counts_every_security(advisor):
+    progress = []
+    
+    asyncio.run(advisor.batch_analyze_securities_async(
+        securities('000001', '000002', 'abc'), 'sk-test', 'test-model',
+        on_progress=lambda done, total: progress.append((done, total))
+    ))
+    
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_callback_errors_do_not_fail_the_batch(advisor, caplog):
+    def on_result(result):
+        raise OSError('No space left on device')
+    
+    def on_progress(done, total):
+        raise ValueError('progress failed')
+    
+    results = asyncio.run(advisor.batch_analyze_securities_async(
+        securities('000001', '000002'), 'sk-test', 'test-model',
+        on_result=on_result, on_progress=on_progress
+    ))
+    
+    assert [result['success'] for result in results] == [True, True]
+    assert [result['symbol'] for result in results] == ['000001', '000002']
+    assert len([record for record in caplog.records if record.name == 'kdas.advisor']) == 4
+
+
+def test_invalid_api_key_fails_without_fetching(advisor, monkeypatch):
+    async def check_api_key(async_client):
+        return False
+    
+    async def load_security(symbol, security_type):
+        raise AssertionError('API密钥无效时不应获取数据')
+    
+    monkeypatch.setattr(advisor_module, 'check_api_key', check_api_key)
+    advisor._load_security_async = load_security
+    
+    results = asyncio.run(advisor.batch_analyze_securities_async(
+        securities('000001', '000002'), 'sk-test', 'test-model'
+    ))
+    
+    assert [result['success'] for result in results] == [False, False]
+    assert all('API密钥无效' in result['error'] for result in results)
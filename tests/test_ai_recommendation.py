@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+AIRecommendationEngine测试：回复缓存键、流式回复的JSON完整性跟踪与提前停止读取
+
+使用方法：
+python -m pytest tests/test_ai_recommendation.py
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import kdas.ai_recommendation as ai_recommendation
+from kdas.ai_recommendation import AIRecommendationEngine, _JSONObjectTracker
+from kdas.response_cache import ResponseCache
+
+
+class FrozenDatetime(datetime):
+    today_value = datetime(2024, 7, 1)
+    
+    @classmethod
+    def now(cls, tz=None):
+        return cls.today_value
+
+
+def recommend(engine, df, security_name='平安银行', security_type='股票'):
+    return engine.generate_kdas_recommendation(df, '000001', security_name, security_type)
+
+
+def test_cache_key_covers_every_prompt_input(make_frame, tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_recommendation, 'datetime', FrozenDatetime)
+    prompts = []
+    
+    engine = AIRecommendationEngine(api_key='sk-test')
+    engine.response_cache = ResponseCache(str(tmp_path), ttl=60)
+    
+    def call_llm(prompt):
+        prompts.append(prompt)
+        return '{"dates": ["2024-03-01"], "reasoning": "r", "confidence": "high"}'
+    
+    engine._call_llm = call_llm
+    df = make_frame()
+    
+    recommend(engine, df)
+    recommend(engine, df)
+    assert len(prompts) == 1
+    
+    # 证券名称、证券类型或prompt中的当天日期变化时都不能复用之前的回复
+    recommend(engine, df, security_name='平安银行A')
+    recommend(engine, df, security_type='指数')
+    monkeypatch.setattr(FrozenDatetime, 'today_value', datetime(2024, 7, 2))
+    recommend(engine, df)
+    assert len(prompts) == 4
+
+
+def feed_all(chunks):
+    """依次输入文本片段，返回判定JSON完整时已输入的片段数量，始终未完整时返回None"""
+    tracker = _JSONObjectTracker()
+    for i, chunk in enumerate(chunks, 1):
+        if tracker.feed(chunk):
+            return i
+    return None
+
+
+def test_tracker_stops_when_recommendation_object_completes():
+    chunks = ['好的，分析如下：\n```json\n{"dat', 'es": ["2024-01-02"], ', '"reasoning": "r"}', '\n```\n以上。']
+    
+    assert feed_all(chunks) == 3
+
+
+def test_tracker_ignores_braces_inside_strings():
+    chunks = ['{"reasoning": "价格在{关键位}附近 \\"}\\" ', '", "dates": []', '}']
+    
+    assert feed_all(chunks) == 3
+
+
+def test_tracker_handles_nested_objects():
+    chunks = ['{"dates": ["2024-01-02"], "detail": {"a": {"b": 1}}', '}']
+    
+    assert feed_all(chunks) == 2
+
+
+def test_tracker_skips_objects_without_dates():
+    chunks = ['示例格式 {"x": 1} 结果：', '{"dates": ["2024-01-02"]}']
+    
+    assert feed_all(chunks) == 2
+
+
+def test_tracker_incomplete_reply_never_stops():
+    assert feed_all(['{"dates": ["2024-01-02"', ', "reasoning": "被截断']) is None
+
+
+class FakeStream:
+    """模拟openai的流式回复，记录被读取的数据块数量和是否已关闭"""
+    
+    def __init__(self, parts):
+        self.parts = parts
+        self.consumed = 0
+        self.closed = False
+    
+    def __aiter__(self):
+        return self._iterate()
+    
+    async def _iterate(self):
+        for part in self.parts:
+            self.consumed += 1
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+    
+    async def close(self):
+        self.closed = True
+
+
+def test_call_llm_async_stops_reading_after_complete_json(monkeypatch):
+    stream = FakeStream(['{"dates": ["2024-01-02"], ', '"reasoning": "r"}', '\n补充说明', '更多内容'])
+    
+    async def create(**kwargs):
+        assert kwargs['stream'] is True
+        return stream
+    
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(ai_recommendation, 'get_shared_async_client', lambda *args: client)
+    monkeypatch.delenv('KDAS_LLM_RATE_PER_MIN', raising=False)
+    engine = AIRecommendationEngine(api_key='sk-test')
+    
+    response = asyncio.run(engine._call_llm_async('prompt'))
+    
+    assert response == '{"dates": ["2024-01-02"], "reasoning": "r"}'
+    assert stream.consumed == 2
+    assert stream.closed
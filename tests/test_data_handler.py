@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+DataHandler测试：Feather数据缓存的写入与calculate_cumulative_vwap
+
+KDAS计算以逐个起始日期用pandas累计求和的写法作为参照，校验NumPy/JIT实现的结果一致
+
+使用方法：
+python -m pytest tests/test_data_handler.py
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import kdas.data_handler as data_handler
+from kdas.data_handler import DataHandler
+
+
+def reference_vwap(df: pd.DataFrame, input_dates: dict) -> pd.DataFrame:
+    """参照实现：每个起始日期从起始行开始用pandas累计求和"""
+    df = df.copy()
+    for value in input_dates.values():
+        start_idx = df.index[df['日期'] == pd.Timestamp(value)]
+        if len(start_idx) == 0:
+            continue
+        start_idx = start_idx[0]
+        df[f'累计成交额{value}'] = np.nan
+        df[f'累计成交量{value}'] = np.nan
+        df[f'KDAS{value}'] = np.nan
+        df.loc[start_idx:, f'累计成交额{value}'] = df.loc[start_idx:, '成交额'].cumsum()
+        df.loc[start_idx:, f'累计成交量{value}'] = df.loc[start_idx:, '成交量'].cumsum()
+        df.loc[start_idx:, f'KDAS{value}'] = (
+            df.loc[start_idx:, f'累计成交额{value}'] / df.loc[start_idx:, f'累计成交量{value}'] / 100
+        ).round(3)
+    return df
+
+
+def assert_same_kdas(result: pd.DataFrame, expected: pd.DataFrame, input_dates: dict):
+    """逐列比较结果；KDAS保存为float32，按3位小数比较，累计值按相对误差比较"""
+    for value in set(input_dates.values()):
+        for prefix, rtol, atol in (('累计成交额', 1e-6, 0), ('累计成交量', 1e-6, 0), ('KDAS', 0, 1e-4)):
+            column = f'{prefix}{value}'
+            assert (column in result.columns) == (column in expected.columns), column
+            if column not in expected.columns:
+                continue
+            np.testing.assert_allclose(
+                result[column].to_numpy(np.float64), expected[column].to_numpy(np.float64),
+                rtol=rtol, atol=atol, equal_nan=True, err_msg=column
+            )
+
+
+def test_cache_roundtrip(make_frame, tmp_path):
+    df = make_frame(30, 0)
+    handler = DataHandler()
+    
+    handler._write_cached_data(df, str(tmp_path / '000001.feather'))
+    
+    pd.testing.assert_frame_equal(handler._read_cached_data(str(tmp_path), '000001'), df)
+    assert os.listdir(tmp_path) == ['000001.feather']
+
+
+def test_concurrent_cache_writes_do_not_collide(make_frame, tmp_path):
+    frames = [make_frame(200, seed) for seed in range(8)]
+    file_path = str(tmp_path / '000001.feather')
+    handler = DataHandler()
+    
+    # 多个线程同时写入同一证券的缓存，每次写入都应成功，且最终文件是其中某一次的完整结果
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda df: handler._write_cached_data(df, file_path), frames))
+    
+    result = handler._read_cached_data(str(tmp_path), '000001')
+    assert any(result.equals(df) for df in frames)
+    assert os.listdir(tmp_path) == ['000001.feather']
+
+
+def test_failed_cache_write_removes_temp_file(make_frame, tmp_path, monkeypatch):
+    def fail(self, path):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+        raise OSError('No space left on device')
+    
+    monkeypatch.setattr(pd.DataFrame, 'to_feather', fail)
+    
+    with pytest.raises(OSError):
+        DataHandler()._write_cached_data(make_frame(5, 0), str(tmp_path / '000001.feather'))
+    assert not os.listdir(tmp_path)
+
+
+def test_vwap_keeps_cumulative_sums_in_float64(make_frame):
+    df = make_frame(250, 1)
+    # 成交活跃的证券累计成交额可达1e11以上
+    df['成交额'] = df['成交额'] * 1000
+    dates = df['日期'].dt.strftime('%Y%m%d').tolist()
+    value = dates[10]
+    
+    result = DataHandler().calculate_cumulative_vwap(df, {'day1': value})
+    
+    expected_amount = df['成交额'].to_numpy()[10:].cumsum()
+    expected_volume = df['成交量'].to_numpy()[10:].cumsum()
+    assert result[f'累计成交额{value}'].dtype == np.float64
+    assert result[f'累计成交量{value}'].dtype == np.float64
+    np.testing.assert_allclose(result[f'累计成交额{value}'].to_numpy()[10:], expected_amount, rtol=1e-12)
+    np.testing.assert_allclose(result[f'累计成交量{value}'].to_numpy()[10:], expected_volume, rtol=1e-12)
+    
+    # KDAS按3位小数取整后保存为float32
+    kdas = result[f'KDAS{value}']
+    assert kdas.dtype == np.float32
+    np.testing.assert_array_equal(
+        kdas.to_numpy()[10:], np.round(expected_amount / expected_volume / 100, 3).astype(np.float32)
+    )
+
+
+@pytest.mark.parametrize('numba_available', [True, False])
+def test_vwap_nan_rows_do_not_spread(make_frame, monkeypatch, numba_available):
+    if numba_available and not data_handler.NUMBA_AVAILABLE:
+        pytest.skip('numba未安装')
+    monkeypatch.setattr(data_handler, 'NUMBA_AVAILABLE', numba_available)
+    
+    df = make_frame(60, 5)
+    df.loc[[3, 20], '成交额'] = np.nan
+    df.loc[[3, 31], '成交量'] = np.nan
+    value = df['日期'].dt.strftime('%Y%m%d').iloc[0]
+    
+    result = DataHandler().calculate_cumulative_vwap(df, {'day1': value})
+    
+    # 与pandas的cumsum一致：只有NaN所在行的累计值和KDAS为NaN，之后的行跳过NaN继续累计
+    expected_amount = df['成交额'].cumsum()
+    expected_volume = df['成交量'].cumsum()
+    np.testing.assert_allclose(result[f'累计成交额{value}'], expected_amount, rtol=1e-12, equal_nan=True)
+    np.testing.assert_allclose(result[f'累计成交量{value}'], expected_volume, rtol=1e-12, equal_nan=True)
+    np.testing.assert_array_equal(
+        result[f'KDAS{value}'].to_numpy(),
+        np.round(expected_amount / expected_volume / 100, 3).to_numpy(np.float32)
+    )
+    assert result[f'KDAS{value}'].isna().sum() == 3
+
+
+@pytest.mark.parametrize('numba_available', [True, False])
+@pytest.mark.parametrize('seed', range(5))
+def test_vwap_matches_pandas_reference(make_frame, monkeypatch, numba_available, seed):
+    if numba_available and not data_handler.NUMBA_AVAILABLE:
+        pytest.skip('numba未安装')
+    monkeypatch.setattr(data_handler, 'NUMBA_AVAILABLE', numba_available)
+    
+    df = make_frame(250, seed)
+    dates = df['日期'].dt.strftime('%Y%m%d').tolist()
+    # 包含重复的起始日期和不在数据范围内的起始日期
+    input_dates = {'day1': dates[0], 'day2': dates[37], 'day3': dates[120], 'day4': dates[37], 'day5': '19990101'}
+    
+    result = DataHandler().calculate_cumulative_vwap(df, input_dates)
+    
+    assert_same_kdas(result, reference_vwap(df, input_dates), input_dates)
+    assert 'KDAS19990101' not in result.columns
+    # 原始列保持不变
+    pd.testing.assert_frame_equal(result[df.columns], df)
+
+
+def test_vwap_zero_volume_rows_match_reference(make_frame):
+    df = make_frame(60, 7)
+    df.loc[:3, '成交量'] = 0
+    df.loc[:1, '成交额'] = 0
+    dates = df['日期'].dt.strftime('%Y%m%d').tolist()
+    input_dates = {'day1': dates[0], 'day2': dates[10]}
+    
+    result = DataHandler().calculate_cumulative_vwap(df, input_dates)
+    
+    assert_same_kdas(result, reference_vwap(df, input_dates), input_dates)
+
+
+def test_vwap_recomputes_existing_kdas_columns(make_frame):
+    df = make_frame(40, 3)
+    dates = df['日期'].dt.strftime('%Y%m%d').tolist()
+    input_dates = {'day1': dates[5]}
+    
+    once = DataHandler().calculate_cumulative_vwap(df, input_dates)
+    twice = DataHandler().calculate_cumulative_vwap(once, input_dates)
+    
+    assert list(twice.columns) == list(once.columns)
+    pd.testing.assert_frame_equal(twice, once)
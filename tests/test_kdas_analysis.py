@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+KDASAnalyzer测试：KDAS状态分析数据的统计量
+
+使用方法：
+python -m pytest tests/test_kdas_analysis.py
+"""
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import kdas.kdas_analysis as kdas_analysis
+from kdas.data_handler import DataHandler
+from kdas.kdas_analysis import KDASAnalyzer
+from kdas.response_cache import ResponseCache
+
+
+@pytest.mark.parametrize('use_jit', [True, False])
+def test_market_data_skips_nan_bars(make_frame, monkeypatch, use_jit):
+    if not use_jit:
+        # 未安装numba时njit直接返回原函数，没有py_func
+        kernel = kdas_analysis._kdas_stats
+        monkeypatch.setattr(kdas_analysis, '_kdas_stats', getattr(kernel, 'py_func', kernel))
+    
+    df = make_frame()
+    input_dates = {'day1': df['日期'].iloc[10].strftime('%Y%m%d')}
+    df = DataHandler().calculate_cumulative_vwap(df, input_dates)
+    # 最近10个交易日中各有一个成交量和收盘价缺失
+    df.loc[len(df) - 4, '成交量'] = np.nan
+    df.loc[len(df) - 6, '收盘'] = np.nan
+    
+    data = KDASAnalyzer()._prepare_kdas_analysis_data(df, input_dates, '000001', '平安银行', '股票')
+    
+    # 与pandas的mean/std一致，跳过NaN
+    latest = df.tail(10)
+    market_data = data['market_data']
+    assert market_data['recent_volume_avg'] == pytest.approx(latest['成交量'].mean())
+    assert market_data['price_volatility'] == pytest.approx(latest['收盘'].std())
+    expected_trend = 'increasing' if latest['成交量'].iloc[-1] > latest['成交量'].mean() else 'decreasing'
+    assert market_data['volume_trend'] == expected_trend
+
+
+class FakeStream:
+    """模拟openai的流式回复，parts中的asyncio.Event表示等待服务端继续发送数据"""
+    
+    def __init__(self, parts):
+        self.parts = parts
+        self.closed = False
+    
+    def __aiter__(self):
+        return self._iterate()
+    
+    async def _iterate(self):
+        for part in self.parts:
+            if isinstance(part, asyncio.Event):
+                await part.wait()
+                continue
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+    
+    async def close(self):
+        self.closed = True
+
+
+def make_streaming_analyzer(monkeypatch, streams):
+    async def create(**kwargs):
+        assert kwargs['stream'] is True
+        return streams.pop(0)
+    
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(kdas_analysis, 'get_shared_async_client', lambda *args: client)
+    monkeypatch.delenv('KDAS_LLM_RATE_PER_MIN', raising=False)
+    analyzer = KDASAnalyzer(api_key='sk-test')
+    analyzer.response_cache = ResponseCache(ttl=0, memory_size=0)
+    analyzer._llm_concurrency = 1
+    return analyzer
+
+
+def test_slow_stream_consumer_does_not_hold_semaphore(monkeypatch):
+    slow = FakeStream(['第一段', '第二段'])
+    other = FakeStream(['其他回复'])
+    analyzer = make_streaming_analyzer(monkeypatch, [slow, other])
+    
+    async def run():
+        stream = analyzer._call_llm_stream('prompt')
+        first = await stream.__anext__()
+        # 调用方暂停消费时，并发上限为1的另一个请求仍能完成
+        response = await asyncio.wait_for(analyzer._call_llm_async('other'), 1)
+        rest = [chunk async for chunk in stream]
+        return first, response, rest
+    
+    assert asyncio.run(run()) == ('第一段', '其他回复', ['第二段'])
+    assert slow.closed and other.closed
+
+
+def test_abandoned_stream_is_closed_and_releases_semaphore(monkeypatch):
+    async def run():
+        never = asyncio.Event()
+        pending = FakeStream(['第一段', never, '不会到达'])
+        other = FakeStream(['其他回复'])
+        analyzer = make_streaming_analyzer(monkeypatch, [pending, other])
+        
+        stream = analyzer._call_llm_stream('prompt')
+        first = await stream.__anext__()
+        # 调用方提前停止迭代，读取中的流被关闭，信号量随之释放
+        await stream.aclose()
+        response = await asyncio.wait_for(analyzer._call_llm_async('other'), 1)
+        return first, pending.closed, response
+    
+    assert asyncio.run(run()) == ('第一段', True, '其他回复')
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+llm_client测试：请求超时设置、共享客户端的关闭、请求限流器、API密钥探测缓存和max_tokens上限
+
+API请求通过httpx.MockTransport模拟，不访问网络
+
+使用方法：
+python -m pytest tests/test_llm_client.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import kdas.llm_client as llm_client
+from kdas.llm_client import (
+    HTTP_TIMEOUT, aclose_shared_clients, get_max_output_tokens,
+    AsyncRateLimiter, llm_rate_limit, get_llm_rate_limiter, check_api_key
+)
+from kdas.ai_recommendation import AIRecommendationEngine
+from kdas.kdas_analysis import KDASAnalyzer
+
+
+@pytest.mark.parametrize('component_class', [AIRecommendationEngine, KDASAnalyzer])
+def test_non_streaming_calls_allow_long_reads(component_class, tmp_path):
+    requests = []
+    
+    def create(**kwargs):
+        requests.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='{"dates": []}'))])
+    
+    component = component_class(api_key='sk-test')
+    component.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    if hasattr(component, 'response_cache'):
+        component.response_cache.ttl = 0
+    
+    component._call_llm('prompt')
+    
+    # 推理模型生成完整回复可能超过60秒，非流式请求不能沿用流式请求的读取超时
+    timeout = requests[0]['timeout']
+    assert timeout.read >= 600
+    assert timeout.connect == HTTP_TIMEOUT.connect
+
+
+def test_aclose_shared_clients_recreates_clients_on_next_use():
+    async def run():
+        engine = AIRecommendationEngine(api_key='sk-test')
+        analyzer = KDASAnalyzer(api_key='sk-test')
+        shared = engine.async_client
+        same_client = analyzer.async_client is shared
+        
+        # 事件循环的所有者关闭全部共享客户端后，再次获取时创建新的客户端
+        await aclose_shared_clients()
+        return same_client, shared.is_closed(), engine.async_client is not shared
+    
+    assert asyncio.run(run()) == (True, True, True)
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = AsyncRateLimiter(rate_per_min=600)  # 每0.1秒放行一个
+    
+    async def run():
+        start = time.monotonic()
+        for _ in range(4):
+            await limiter.acquire()
+        return time.monotonic() - start
+    
+    assert asyncio.run(run()) >= 0.29
+
+
+def test_rate_limit_context_is_inherited_by_tasks(monkeypatch):
+    monkeypatch.delenv('KDAS_LLM_RATE_PER_MIN', raising=False)
+    
+    async def run():
+        with llm_rate_limit(120):
+            inner = await asyncio.create_task(asyncio.sleep(0, get_llm_rate_limiter()))
+        return inner, get_llm_rate_limiter()
+    
+    inner, outer = asyncio.run(run())
+    assert isinstance(inner, AsyncRateLimiter)
+    assert inner.interval == 0.5
+    assert outer is None
+
+
+def make_client(api_key, handler):
+    transport = httpx.MockTransport(handler)
+    return AsyncOpenAI(api_key=api_key, base_url='http://llm.test/v1', http_client=httpx.AsyncClient(transport=transport))
+
+
+def test_check_api_key_caches_definitive_results(monkeypatch):
+    monkeypatch.setattr(llm_client, '_api_key_status', {})
+    calls = []
+    
+    def handler(request):
+        calls.append(request.headers['authorization'])
+        if request.headers['authorization'].endswith('bad'):
+            return httpx.Response(401, json={'error': {'message': 'invalid api key'}})
+        return httpx.Response(200, json={'object': 'list', 'data': []})
+    
+    async def run():
+        return [await check_api_key(make_client(key, handler)) for key in ('sk-good', 'sk-good', 'sk-bad', 'sk-bad')]
+    
+    assert asyncio.run(run()) == [True, True, False, False]
+    assert len(calls) == 2
+
+
+def test_check_api_key_does_not_cache_inconclusive_probes(monkeypatch):
+    monkeypatch.setattr(llm_client, '_api_key_status', {})
+    calls = []
+    
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(404, json={})
+    
+    async def run():
+        return [await check_api_key(make_client('sk-any', handler)) for _ in range(2)]
+    
+    assert asyncio.run(run()) == [True, True]
+    assert len(calls) == 2
+
+
+def test_check_api_key_reprobes_after_ttl(monkeypatch):
+    monkeypatch.setattr(llm_client, '_api_key_status', {})
+    monkeypatch.setattr(llm_client, 'API_KEY_STATUS_TTL', 0)
+    replies = [401, 200]
+    
+    def handler(request):
+        status = replies.pop(0)
+        return httpx.Response(status, json={'error': {'message': 'invalid'}} if status == 401 else {'data': []})
+    
+    async def run():
+        first = await check_api_key(make_client('sk-fixed', handler))
+        await asyncio.sleep(0.01)
+        return first, await check_api_key(make_client('sk-fixed', handler))
+    
+    assert asyncio.run(run()) == (False, True)
+
+
+def test_max_output_tokens_by_model(monkeypatch):
+    monkeypatch.delenv('KDAS_LLM_MAX_OUTPUT_TOKENS', raising=False)
+    assert get_max_output_tokens('gpt-4') == 4096
+    assert get_max_output_tokens('gpt-4o-mini') == 16384
+    assert get_max_output_tokens('deepseek-r1') == 8192
+    assert get_max_output_tokens('unknown-model') == llm_client.DEFAULT_MAX_OUTPUT_TOKENS
+    
+    monkeypatch.setenv('KDAS_LLM_MAX_OUTPUT_TOKENS', '1000')
+    assert get_max_output_tokens('gpt-4o') == 1000
+
+
+def test_loop_resources_are_released(monkeypatch):
+    monkeypatch.setattr(llm_client, '_shared_async_clients', {})
+    monkeypatch.setattr(llm_client, '_loop_semaphores', {})
+    analyzer = KDASAnalyzer(api_key='sk-test')
+    
+    async def use_loop(close_clients):
+        analyzer.async_client
+        async with analyzer._get_llm_semaphore():
+            pass
+        if close_clients:
+            await aclose_shared_clients()
+    
+    # 事件循环的所有者关闭前调用aclose_shared_clients时，客户端和信号量立即释放
+    for _ in range(3):
+        asyncio.run(use_loop(True))
+    assert not llm_client._shared_async_clients
+    assert not llm_client._loop_semaphores
+    
+    # 未释放就关闭的事件循环，在其他事件循环下次获取时从缓存中移除
+    for _ in range(3):
+        asyncio.run(use_loop(False))
+    assert len(llm_client._shared_async_clients) == 1
+    assert len(llm_client._loop_semaphores) == 1
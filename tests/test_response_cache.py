@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+ResponseCache测试：有效期、空回复处理、内存LRU与磁盘缓存
+
+使用方法：
+python -m pytest tests/test_response_cache.py
+"""
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from kdas.response_cache import ResponseCache
+
+
+def test_set_and_get_roundtrip(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    key = ResponseCache.make_key('model', [{'role': 'user', 'content': 'prompt'}])
+    
+    cache.set(key, '{"dates": []}')
+    
+    assert cache.get(key) == '{"dates": []}'
+    # 新实例没有内存缓存，从磁盘读取
+    assert ResponseCache(str(tmp_path), ttl=60).get(key) == '{"dates": []}'
+
+
+def test_make_key_is_deterministic():
+    assert ResponseCache.make_key('m', {'b': 1, 'a': 2}) == ResponseCache.make_key('m', {'a': 2, 'b': 1})
+    assert ResponseCache.make_key('m', 'x') != ResponseCache.make_key('m', 'y')
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.set('k', 'reply')
+    
+    # 内存和磁盘中的条目都超过有效期
+    written_at, response = cache._memory['k']
+    cache._memory['k'] = (written_at - 120, response)
+    old = time.time() - 120
+    os.utime(tmp_path / 'k.json', (old, old))
+    
+    assert cache.get('k') is None
+    assert ResponseCache(str(tmp_path), ttl=60).get('k') is None
+
+
+def test_ttl_zero_disables_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=0)
+    cache.set('k', 'reply')
+    
+    assert cache.get('k') is None
+    assert not os.listdir(tmp_path)
+
+
+def test_empty_reply_is_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.set('k', '')
+    cache.set('n', None)
+    
+    assert cache.get('k') is None
+    assert cache.get('n') is None
+    assert not os.listdir(tmp_path)
+
+
+def test_empty_reply_on_disk_is_a_miss(tmp_path):
+    with open(tmp_path / 'k.json', 'w', encoding='utf-8') as f:
+        json.dump({'response': ''}, f)
+    
+    assert ResponseCache(str(tmp_path), ttl=60).get('k') is None
+
+
+def test_corrupt_file_is_a_miss(tmp_path):
+    (tmp_path / 'k.json').write_text('{not json', encoding='utf-8')
+    
+    assert ResponseCache(str(tmp_path), ttl=60).get('k') is None
+
+
+def test_memory_lru_evicts_oldest_and_falls_back_to_disk(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60, memory_size=2)
+    for key in ('a', 'b', 'c'):
+        cache.set(key, f'reply-{key}')
+    
+    assert list(cache._memory) == ['b', 'c']
+    assert cache.get('a') == 'reply-a'
+    assert list(cache._memory) == ['c', 'a']
+
+
+def test_concurrent_writes_to_same_key(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60, memory_size=0)
+    replies = [f'reply-{i}' * 1000 for i in range(16)]
+    
+    # 线程池中的多个线程同时写入同一个键，每次写入使用各自的临时文件
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda reply: cache.set('k', reply), replies))
+    
+    assert cache.get('k') in replies
+    assert os.listdir(tmp_path) == ['k.json']
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+technical_analysis测试：滚动均值与技术分析结果缓存
+
+使用方法：
+python -m pytest tests/test_technical_analysis.py
+"""
+
+import copy
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from kdas.technical_analysis import TechnicalAnalyzer, _rolling_mean
+
+
+@pytest.mark.parametrize('nan_positions', [[], [3], [0, 1], list(range(10, 32)), [99]])
+def test_rolling_mean_matches_pandas(nan_positions):
+    values = np.random.default_rng(0).random(100) * 1e7
+    values[nan_positions] = np.nan
+    
+    expected = pd.Series(values).rolling(window=20, min_periods=1).mean().to_numpy()
+    
+    # NaN只影响包含它的窗口
+    np.testing.assert_allclose(_rolling_mean(values, 20), expected, rtol=1e-9, equal_nan=True)
+
+
+def test_cached_analysis_is_not_shared_with_callers(make_frame):
+    analyzer = TechnicalAnalyzer()
+    df = make_frame()
+    
+    first = analyzer.analyze_technical_indicators(df)
+    expected = copy.deepcopy(first)
+    first['price_stats']['current_price'] = -1
+    first['extra'] = 'ui'
+    
+    second = analyzer.analyze_technical_indicators(df)
+    assert second == expected
+    second['price_stats'].clear()
+    
+    # 调用方修改返回值不影响缓存中的结果
+    assert analyzer.analyze_technical_indicators(df) == expected
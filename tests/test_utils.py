@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+utils测试：JSON转换与序列化
+
+使用方法：
+python -m pytest tests/test_utils.py
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import kdas.utils as utils
+from kdas.utils import dumps_json, safe_json_convert
+
+
+DATA = {
+    'a': np.float64('nan'),
+    'b': np.float32('nan'),
+    'c': float('nan'),
+    'd': np.array([1.5, np.nan]),
+    'e': [np.float64(2.5), {'f': np.int64(3)}],
+    '名称': np.bool_(True),
+}
+
+EXPECTED = {'a': None, 'b': None, 'c': None, 'd': [1.5, None], 'e': [2.5, {'f': 3}], '名称': True}
+
+
+def test_safe_json_convert_maps_nan_to_none():
+    assert safe_json_convert(DATA) == EXPECTED
+
+
+@pytest.mark.parametrize('indent', [True, False])
+def test_dumps_json_without_orjson_emits_valid_json(monkeypatch, indent):
+    monkeypatch.setattr(utils, 'orjson', None)
+    
+    text = dumps_json(DATA, indent=indent)
+    
+    assert 'NaN' not in text
+    assert '名称' in text
+    assert json.loads(text) == EXPECTED